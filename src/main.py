@@ -1,10 +1,15 @@
+import logging
+import logging.handlers
 import os
+import queue
 import sys
 from datetime import timedelta
 # DON'T CHANGE THIS !!!
 sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
 
+import orjson
 from flask import Flask, send_from_directory, jsonify
+from flask.json.provider import DefaultJSONProvider
 from flask_cors import CORS
 from flask_jwt_extended import JWTManager
 from flask_migrate import Migrate
@@ -14,6 +19,7 @@ from dotenv import load_dotenv
 load_dotenv()
 
 from src.models.database import db
+from src.utils.auth import is_token_revoked
 from src.routes.auth import auth_bp
 from src.routes.users import users_bp
 from src.routes.pharmacies import pharmacies_bp
@@ -23,8 +29,63 @@ from src.routes.cart import cart_bp
 from src.routes.orders import orders_bp
 from src.routes.admin import admin_bp
 
+class OrjsonProvider(DefaultJSONProvider):
+    """JSON provider backed by orjson
+
+    orjson serializes in native code and emits bytes directly, so every
+    jsonify() call across the blueprints skips the stdlib encoder and the
+    str->bytes copy. Non-native types (Decimal, etc.) fall back to the
+    default handler inherited from Flask.
+    """
+
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, default=self.default,
+                            option=orjson.OPT_NON_STR_KEYS).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(
+            orjson.dumps(obj, default=self.default,
+                         option=orjson.OPT_NON_STR_KEYS),
+            mimetype='application/json'
+        )
+
+_log_listener = None
+
+def configure_logging():
+    """Route log records through a queue so request threads never block on I/O
+
+    Handlers enqueue records (cheap, in-memory); a single listener thread
+    drains the queue to stdout. Bursts of errors no longer serialize
+    workers on synchronous stream writes.
+    """
+    global _log_listener
+    if _log_listener is not None:
+        return
+
+    log_queue = queue.SimpleQueue()
+    stream_handler = logging.StreamHandler()
+    stream_handler.setFormatter(logging.Formatter(
+        '%(asctime)s %(levelname)s %(name)s: %(message)s'))
+    _log_listener = logging.handlers.QueueListener(log_queue, stream_handler)
+    _log_listener.start()
+
+    root_logger = logging.getLogger()
+    # Drop handlers installed before us (e.g. logging.basicConfig at
+    # import time) so every record goes through the queue exactly once
+    # instead of also hitting a synchronous stream handler
+    root_logger.handlers.clear()
+    root_logger.addHandler(logging.handlers.QueueHandler(log_queue))
+    root_logger.setLevel(os.getenv('LOG_LEVEL', 'INFO').upper())
+
 def create_app():
     app = Flask(__name__, static_folder=os.path.join(os.path.dirname(__file__), 'static'))
+
+    configure_logging()
+    app.json = OrjsonProvider(app)
     
     # Configuration
     app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'dev-secret-key-dawaksahl-2025')
@@ -43,7 +104,16 @@ def create_app():
         app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{db_path}'
     else:
         app.config['SQLALCHEMY_DATABASE_URI'] = database_url
-    
+        # Persistent connection pool so requests reuse server connections
+        # instead of paying a TCP/TLS handshake per query
+        app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
+            'pool_size': int(os.getenv('DB_POOL_SIZE', 10)),
+            'max_overflow': int(os.getenv('DB_MAX_OVERFLOW', 20)),
+            'pool_timeout': 30,
+            'pool_recycle': 1800,
+            'pool_pre_ping': True
+        }
+
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
     
     # File Upload Configuration
@@ -76,6 +146,15 @@ def create_app():
     app.register_blueprint(orders_bp, url_prefix='/api/orders')
     app.register_blueprint(admin_bp, url_prefix='/api/admin')
     
+    # Reject tokens revoked via logout
+    @jwt.token_in_blocklist_loader
+    def token_in_blocklist_callback(jwt_header, jwt_payload):
+        return is_token_revoked(jwt_payload['jti'])
+
+    @jwt.revoked_token_loader
+    def revoked_token_callback(jwt_header, jwt_payload):
+        return jsonify({'message': 'Token has been revoked', 'error': 'token_revoked'}), 401
+
     # JWT Error Handlers
     @jwt.expired_token_loader
     def expired_token_callback(jwt_header, jwt_payload):
@@ -96,6 +175,12 @@ def create_app():
     
     # Create database tables
     with app.app_context():
+        # The trigram indexes on products need pg_trgm before create_all
+        # renders them; no-op on other dialects
+        if db.engine.dialect.name == 'postgresql':
+            with db.engine.connect() as conn:
+                conn.execute(db.text('CREATE EXTENSION IF NOT EXISTS pg_trgm'))
+                conn.commit()
         db.create_all()
     
     return app
@@ -120,4 +205,4 @@ def serve(path):
             return jsonify({'message': 'DawakSahl API is running', 'version': '1.0.0'})
 
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=5000, debug=os.getenv('FLASK_DEBUG', 'True').lower() == 'true')
+    app.run(host='0.0.0.0', port=5000, threaded=True, debug=os.getenv('FLASK_DEBUG', 'True').lower() == 'true')
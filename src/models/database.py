@@ -11,16 +11,23 @@ class BaseModel(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
     
-    def to_dict(self):
-        """Convert model instance to dictionary"""
-        result = {}
-        for column in self.__table__.columns:
-            value = getattr(self, column.name)
-            if isinstance(value, datetime):
-                result[column.name] = value.isoformat()
-            else:
-                result[column.name] = value
-        return result
+    def to_dict(self, fields=None):
+        """Convert model instance to dictionary
+
+        Values are left raw: the app-wide orjson provider serializes
+        datetimes natively (RFC 3339, matching isoformat), so there is no
+        per-field type check or isoformat() call in Python. The column
+        name tuple is computed once per model class. Pass `fields` to
+        build only a subset, e.g. for audit snapshots of updatable
+        columns; unknown names are ignored.
+        """
+        names = self.__class__.__dict__.get('_column_names')
+        if names is None:
+            names = tuple(column.name for column in self.__table__.columns)
+            self.__class__._column_names = names
+        if fields is not None:
+            return {name: getattr(self, name) for name in names if name in fields}
+        return {name: getattr(self, name) for name in names}
     
     def update_from_dict(self, data):
         """Update model instance from dictionary"""
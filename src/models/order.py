@@ -32,7 +32,16 @@ class DeliveryMethod(enum.Enum):
 
 class Order(BaseModel):
     __tablename__ = 'orders'
-    
+    __table_args__ = (
+        # Composite indexes matching get_orders' filter + ORDER BY
+        # created_at DESC, id DESC: the customer and pharmacy listings
+        # each become a single descending index range scan
+        db.Index('ix_orders_customer_created', 'customer_id', db.desc('created_at'), db.desc('id')),
+        db.Index('ix_orders_pharmacy_created', 'pharmacy_id', db.desc('created_at'), db.desc('id')),
+        # Admin listings filtered by status share the same sort
+        db.Index('ix_orders_status_created', 'status', db.desc('created_at'), db.desc('id')),
+    )
+
     # Order Identification
     order_number = db.Column(db.String(20), unique=True, nullable=False)
     
@@ -223,11 +232,17 @@ class ShoppingCart(BaseModel):
 
 class CartItem(BaseModel):
     __tablename__ = 'cart_items'
-    
+    __table_args__ = (
+        # One row per listing per cart; add_to_cart upserts against this
+        db.UniqueConstraint('cart_id', 'pharmacy_product_id', name='uq_cart_items_cart_listing'),
+    )
+
+
     # References
-    cart_id = db.Column(db.Integer, db.ForeignKey('shopping_carts.id'), nullable=False)
+    cart_id = db.Column(db.Integer, db.ForeignKey('shopping_carts.id'), nullable=False, index=True)
     product_id = db.Column(db.Integer, db.ForeignKey('products.id'), nullable=False)
     pharmacy_id = db.Column(db.Integer, db.ForeignKey('pharmacies.id'), nullable=False)
+    pharmacy_product_id = db.Column(db.Integer, db.ForeignKey('pharmacy_products.id'), nullable=True, index=True)
     
     # Product Information (snapshot)
     product_name = db.Column(db.String(255), nullable=False)
@@ -241,10 +256,15 @@ class CartItem(BaseModel):
     
     # Relationships
     pharmacy = db.relationship('Pharmacy', backref='cart_items')
-    
+    pharmacy_product = db.relationship('PharmacyProduct', backref='cart_items')
+
     def calculate_total(self):
         """Calculate total price for this item"""
         self.total_price = self.quantity * self.unit_price
+
+    def get_total_price(self):
+        """Total price for this line as a float"""
+        return float(self.total_price) if self.total_price else 0.0
     
     def to_dict(self):
         """Convert to dictionary"""
@@ -83,20 +83,27 @@ class Pharmacy(BaseModel):
             return "24 Hours"
         return f"{self.opening_time.strftime('%I:%M %p')} - {self.closing_time.strftime('%I:%M %p')}"
     
-    def to_dict(self, include_sensitive=False):
-        """Convert to dictionary"""
-        data = super().to_dict()
-        data['status'] = self.status.value if self.status else None
-        data['is_open_now'] = self.is_open_now()
-        data['operating_hours'] = self.get_operating_hours_display()
-        data['latitude'] = float(data['latitude']) if data['latitude'] else None
-        data['longitude'] = float(data['longitude']) if data['longitude'] else None
-        data['average_rating'] = float(data['average_rating']) if data['average_rating'] else 0.0
-        
+    def to_dict(self, include_sensitive=False, fields=None):
+        """Convert to dictionary, optionally restricted to `fields`"""
+        data = super().to_dict(fields=fields)
+        if 'status' in data:
+            data['status'] = self.status.value if self.status else None
+        if 'latitude' in data:
+            data['latitude'] = float(data['latitude']) if data['latitude'] else None
+        if 'longitude' in data:
+            data['longitude'] = float(data['longitude']) if data['longitude'] else None
+        if 'average_rating' in data:
+            data['average_rating'] = float(data['average_rating']) if data['average_rating'] else 0.0
+
+        # Derived display fields only belong on the full payload
+        if fields is None:
+            data['is_open_now'] = self.is_open_now()
+            data['operating_hours'] = self.get_operating_hours_display()
+
         if not include_sensitive:
             data.pop('license_number', None)
             data.pop('tax_number', None)
-        
+
         return data
     
     def __repr__(self):
@@ -133,12 +140,20 @@ class PharmacyDocument(BaseModel):
         return f'<PharmacyDocument {self.document_type} for {self.pharmacy_id}>'
 class PharmacyOperatingHours(BaseModel):
     __tablename__ = 'pharmacy_operating_hours'
+    __table_args__ = (
+        # One row per pharmacy per weekday; set_operating_hours rewrites
+        # the week against this
+        db.UniqueConstraint('pharmacy_id', 'day_of_week', name='uq_operating_hours_pharmacy_day'),
+    )
 
     pharmacy_id = db.Column(db.Integer, db.ForeignKey('pharmacies.id'), nullable=False)
     day_of_week = db.Column(db.String(20), nullable=False)  # e.g., 'Monday'
-    opening_time = db.Column(db.Time, nullable=False)
-    closing_time = db.Column(db.Time, nullable=False)
+    # Times are nullable: closed days carry no hours
+    opening_time = db.Column(db.Time, nullable=True)
+    closing_time = db.Column(db.Time, nullable=True)
     is_closed = db.Column(db.Boolean, default=False, nullable=False)
+    break_start_time = db.Column(db.Time, nullable=True)
+    break_end_time = db.Column(db.Time, nullable=True)
 
     pharmacy = db.relationship('Pharmacy', backref='operating_hours')
 
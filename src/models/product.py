@@ -10,7 +10,21 @@ class ProductStatus(enum.Enum):
 
 class Product(BaseModel):
     __tablename__ = 'products'
-    
+    __table_args__ = (
+        # Trigram GIN indexes turn the catalog's ILIKE '%term%' filters
+        # into index scans on Postgres (requires the pg_trgm extension,
+        # created at startup). Other dialects render these as plain
+        # indexes and keep their previous scan behaviour
+        db.Index('ix_products_name_trgm', 'name',
+                 postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'}),
+        db.Index('ix_products_name_ar_trgm', 'name_ar',
+                 postgresql_using='gin', postgresql_ops={'name_ar': 'gin_trgm_ops'}),
+        db.Index('ix_products_brand_trgm', 'brand',
+                 postgresql_using='gin', postgresql_ops={'brand': 'gin_trgm_ops'}),
+        db.Index('ix_products_manufacturer_trgm', 'manufacturer',
+                 postgresql_using='gin', postgresql_ops={'manufacturer': 'gin_trgm_ops'}),
+    )
+
     # Basic Information
     name = db.Column(db.String(255), nullable=False)
     name_ar = db.Column(db.String(255), nullable=True)
@@ -175,6 +189,17 @@ class ProductCategory(BaseModel):
         
 class PharmacyProduct(BaseModel):
     __tablename__ = 'pharmacy_products'
+    __table_args__ = (
+        # One listing per product per pharmacy; add_pharmacy_product
+        # inserts against this and maps the violation to a 409. The
+        # backing unique index also serves (pharmacy_id, product_id)
+        # lookups, so no separate composite index is needed
+        db.UniqueConstraint('pharmacy_id', 'product_id', name='uq_pharmacy_products_listing'),
+        # Covers the inventory listing's keyset walk:
+        # WHERE pharmacy_id = ? ORDER BY created_at DESC, id DESC
+        db.Index('ix_pharmacy_products_pharmacy_created', 'pharmacy_id',
+                 db.desc('created_at'), db.desc('id')),
+    )
 
     pharmacy_id        = db.Column(db.Integer, db.ForeignKey('pharmacies.id'), nullable=False)
     product_id         = db.Column(db.Integer, db.ForeignKey('products.id'),   nullable=False)
@@ -188,10 +213,26 @@ class PharmacyProduct(BaseModel):
     is_available       = db.Column(db.Boolean, default=True, nullable=False)
 
     product  = db.relationship('Product', backref='pharmacy_products')
+    pharmacy = db.relationship('Pharmacy', backref='pharmacy_products')
 
-    def to_dict(self):
-        data       = super().to_dict()
-        data['price'] = float(data['price']) if data['price'] else 0.0
+    def is_in_stock(self):
+        """Whether the listing can currently be ordered"""
+        return self.is_available and self.quantity_available > 0
+
+    def can_order_quantity(self, quantity):
+        """Whether the requested quantity fits stock and per-order limits"""
+        if quantity > self.quantity_available:
+            return False
+        if self.minimum_quantity and quantity < self.minimum_quantity:
+            return False
+        if self.maximum_quantity and quantity > self.maximum_quantity:
+            return False
+        return True
+
+    def to_dict(self, fields=None):
+        data = super().to_dict(fields=fields)
+        if 'price' in data:
+            data['price'] = float(data['price']) if data['price'] else 0.0
         return data
 
     def __repr__(self):
@@ -2,13 +2,19 @@ from .database import db, BaseModel
 from werkzeug.security import generate_password_hash, check_password_hash
 from datetime import datetime
 import enum
-import secrets
+
+from src.utils.token_pool import next_token
 
 class UserType(enum.Enum):
     CUSTOMER = 'customer'
     SELLER = 'seller'
     ADMIN = 'admin'
 
+# Hash method and work factor pinned once at module scope so every
+# set_password() call shares the same configuration instead of
+# re-deriving werkzeug's default per call
+PASSWORD_HASH_METHOD = 'pbkdf2:sha256:600000'
+
 class User(BaseModel):
     __tablename__ = 'users'
     
@@ -22,13 +28,19 @@ class User(BaseModel):
     # User Type and Status (matching existing database)
     user_type = db.Column(db.Enum(UserType), nullable=False, default=UserType.CUSTOMER)
     is_verified = db.Column(db.Boolean, default=False, nullable=False)
-    verification_token = db.Column(db.String(255), nullable=True)
+    verification_token = db.Column(db.String(255), nullable=True, index=True)
     is_active = db.Column(db.Boolean, default=True, nullable=False)
     
     # Profile Information (matching existing database)
     profile_picture_url = db.Column(db.Text, nullable=True)
     preferred_language = db.Column(db.String(5), default='ar', nullable=False)
     last_login = db.Column(db.DateTime, nullable=True)
+
+    # Password Reset
+    # Reset tokens are self-verifying (signed user id + this counter);
+    # bumping the counter on a successful reset invalidates any tokens
+    # still in flight without storing them
+    password_reset_generation = db.Column(db.Integer, default=0, nullable=False)
     
     # Relationships
     addresses = db.relationship('UserAddress', backref='user', lazy=True, cascade='all, delete-orphan')
@@ -38,7 +50,7 @@ class User(BaseModel):
     
     def set_password(self, password):
         """Set password hash"""
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = generate_password_hash(password, method=PASSWORD_HASH_METHOD)
     
     def check_password(self, password):
         """Check password against hash"""
@@ -50,7 +62,7 @@ class User(BaseModel):
     
     def generate_verification_token(self):
         """Generate email verification token"""
-        self.verification_token = secrets.token_urlsafe(32)
+        self.verification_token = next_token()
     
     # Properties to match the auth.py expectations
     @property
@@ -94,34 +106,36 @@ class User(BaseModel):
         pass  # Can be implemented when column is added
     
     @property
-    def password_reset_token(self):
-        """Placeholder for password_reset_token"""
-        return getattr(self, '_password_reset_token', None)
-    
-    @password_reset_token.setter
-    def password_reset_token(self, value):
-        """Placeholder setter for password_reset_token"""
-        self._password_reset_token = value
-    
-    @property
-    def password_reset_sent_at(self):
-        """Placeholder for password_reset_sent_at"""
-        return getattr(self, '_password_reset_sent_at', None)
-    
-    @password_reset_sent_at.setter
-    def password_reset_sent_at(self, value):
-        """Placeholder setter for password_reset_sent_at"""
-        self._password_reset_sent_at = value
-    @property
     def get_full_name(self):
         return f"{self.first_name} {self.last_name}".strip()
     
+    def to_public_dict(self):
+        """Compact fixed-schema payload for authenticated responses
+
+        Direct attribute reads instead of iterating table columns, limited
+        to the fields clients render after login/refresh.
+        """
+        return {
+            'id': self.id,
+            'email': self.email,
+            'first_name': self.first_name,
+            'last_name': self.last_name,
+            'full_name': self.get_full_name,
+            'phone_number': self.phone_number,
+            'user_type': self.user_type.value if self.user_type else None,
+            'email_verified': self.is_verified,
+            'is_active': self.is_active,
+            'preferred_language': self.preferred_language,
+            'profile_picture_url': self.profile_picture_url
+        }
+
     def to_dict(self, include_sensitive=False):
         """Convert to dictionary, optionally excluding sensitive data"""
         data = super().to_dict()
         if not include_sensitive:
             data.pop('password_hash', None)
             data.pop('verification_token', None)
+            data.pop('password_reset_generation', None)
         data['full_name'] = self.get_full_name
         data['user_type'] = self.user_type.value if self.user_type else None
         data['email_verified'] = self.is_verified  # Alias for compatibility
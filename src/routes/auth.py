@@ -1,15 +1,189 @@
-from flask import Blueprint, request, jsonify
-from flask_jwt_extended import create_access_token, create_refresh_token, jwt_required, get_jwt_identity
-from datetime import datetime, timedelta
-import secrets
+from flask import Blueprint, request, jsonify, current_app
+from flask_jwt_extended import create_access_token, create_refresh_token, decode_token, jwt_required, get_jwt_identity, get_jwt
+from itsdangerous import BadSignature, SignatureExpired, URLSafeTimedSerializer
+from sqlalchemy import update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import joinedload, load_only, selectinload
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+import hmac
+import logging
+import time
+
+from werkzeug.security import check_password_hash, generate_password_hash
 
 from src.models import db, User, UserAddress, Pharmacy, UserType, PharmacyStatus
-from src.utils.validation import validate_email, validate_password, validate_phone
-from src.utils.auth import log_audit_action
-from src.utils.email import send_verification_email, send_password_reset_email
+from src.models.user import PASSWORD_HASH_METHOD
+from src.utils.validation import validate_email, validate_password, validate_phone, compile_required_fields
+from src.utils.auth import is_token_revoked, log_audit_action, rate_limit, revoke_token
+from src.utils.email import send_verification_email, send_password_reset_email, send_email_async
+
+logger = logging.getLogger(__name__)
 
 auth_bp = Blueprint('auth', __name__)
 
+# Required-field validators compiled once at import so the handlers don't
+# rebuild field lists or validator state on every request
+_check_register_fields = compile_required_fields(
+    ('email', 'password', 'first_name', 'last_name', 'user_type'))
+_check_pharmacy_fields = compile_required_fields(
+    ('name', 'district_id', 'address', 'phone'), prefix='Pharmacy ')
+_check_reset_fields = compile_required_fields(('token', 'new_password'))
+
+# Hash verified when the email doesn't match any account, so login takes
+# the same KDF time whether or not the user exists (no enumeration by
+# timing) without paying a second hash for real users
+_DUMMY_HASH = generate_password_hash('__invalid__', method=PASSWORD_HASH_METHOD)
+
+# Enum-to-string conversions resolved once at import; responses index
+# this map instead of touching the descriptor-backed .value per request
+_USERTYPE_STR = {u: u.value for u in UserType}
+
+# Short-TTL cache of user account state (user_id -> (expires_at, is_active))
+# so chatty refresh() clients skip the per-request user lookup; entries are
+# invalidated on state-changing auth events and age out within the TTL
+_user_state_cache = {}
+_USER_STATE_TTL = 60  # seconds
+
+def _cached_is_active(user_id):
+    """Return the cached is_active flag for a user, loading it on miss"""
+    now = time.monotonic()
+    cached = _user_state_cache.get(user_id)
+    if cached and cached[0] > now:
+        return cached[1]
+
+    # Fetch just the flag rather than hydrating the full user row
+    is_active = bool(db.session.execute(
+        db.select(User.is_active).where(User.id == user_id)
+    ).scalar())
+    if len(_user_state_cache) > 5000:
+        _user_state_cache.clear()
+    _user_state_cache[user_id] = (now + _USER_STATE_TTL, is_active)
+    return is_active
+
+def _invalidate_user_state(user_id):
+    """Drop a user's cached account state after an auth-relevant change"""
+    _user_state_cache.pop(user_id, None)
+    _issued_tokens.pop(user_id, None)
+
+# Access tokens issued by login(), keyed by user id, so a client that
+# logs in repeatedly reuses its token while it still has most of its
+# lifetime left instead of forcing a fresh signing each time
+_issued_tokens = {}
+
+def _access_token_for(user_id):
+    """Return a cached access token with >50% lifetime left, else mint one"""
+    now = time.time()
+    lifetime = current_app.config['JWT_ACCESS_TOKEN_EXPIRES'].total_seconds()
+
+    cached = _issued_tokens.get(user_id)
+    # Recheck the global blocklist before reuse: logout may have revoked
+    # the token through another worker, which only clears that worker's
+    # per-process cache
+    if cached and cached[1] - now > lifetime / 2 and not is_token_revoked(cached[2]):
+        return cached[0]
+
+    # Identities are minted as strings: PyJWT enforces a string 'sub'
+    # claim, so an int identity fails validation on every decode
+    token = create_access_token(identity=str(user_id))
+    if len(_issued_tokens) > 5000:
+        _issued_tokens.clear()
+    jti = decode_token(token)['jti']
+    _issued_tokens[user_id] = (token, now + lifetime, jti)
+    return token
+
+# Password reset tokens are self-verifying: a signed (user_id, generation)
+# pair instead of a random value persisted per request. forgot_password()
+# needs no write and reset_password() resolves the user by primary key;
+# bumping password_reset_generation invalidates outstanding tokens.
+_RESET_TOKEN_MAX_AGE = 24 * 3600  # seconds
+_reset_serializer = None
+
+def _get_reset_serializer():
+    global _reset_serializer
+    if _reset_serializer is None:
+        _reset_serializer = URLSafeTimedSerializer(
+            current_app.config['SECRET_KEY'], salt='password-reset')
+    return _reset_serializer
+
+# Single-threaded worker for fire-and-forget DB touches (last_login,
+# email-action dispatch); one thread keeps the writes ordered and caps
+# the extra pool connections at one
+_bg_writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix='auth-writer')
+
+def _touch_last_login(user_id, logged_in_at):
+    """Record last_login in the background so login() skips the commit"""
+    app = current_app._get_current_object()
+
+    def _write():
+        with app.app_context():
+            try:
+                db.session.execute(
+                    update(User)
+                    .where(User.id == user_id)
+                    .values(last_login=logged_in_at)
+                )
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+                logger.exception("Failed to record last_login for user %s", user_id)
+
+    _bg_writer.submit(_write)
+
+def _forgot_password_bg(app, email):
+    """Background half of forgot_password: lookup, sign token, send email"""
+    with app.app_context():
+        try:
+            row = db.session.execute(
+                db.select(
+                    User.id, User.password_reset_generation,
+                    User.email, User.first_name, User.last_name,
+                    User.preferred_language
+                ).where(User.email == email)
+            ).first()
+            if row is None:
+                return
+
+            reset_token = _get_reset_serializer().dumps(
+                [row.id, row.password_reset_generation])
+            send_email_async(
+                send_password_reset_email,
+                row.email,
+                f"{row.first_name} {row.last_name}".strip(),
+                reset_token,
+                row.preferred_language
+            )
+        except Exception:
+            logger.exception("Password reset dispatch failed for %s", email)
+
+def _resend_verification_bg(app, email):
+    """Background half of resend_verification: lookup, new token, send email"""
+    with app.app_context():
+        try:
+            user = User.query.filter_by(email=email).first()
+            if user is None or user.is_verified:
+                return
+
+            user.generate_verification_token()
+            db.session.commit()
+            send_email_async(
+                send_verification_email,
+                user_email=user.email,
+                user_name=f"{user.first_name} {user.last_name}".strip(),
+                verification_token=user.verification_token,
+                language=user.preferred_language
+            )
+        except Exception:
+            db.session.rollback()
+            logger.exception("Verification resend dispatch failed for %s", email)
+
+def _error(message, status_code, **extra):
+    """Build the standard error response without a dict literal per branch"""
+    payload = {'success': False, 'message': message}
+    if extra:
+        payload.update(extra)
+    return jsonify(payload), status_code
+
 @auth_bp.route('/register', methods=['POST'])
 def register():
     """Register a new user"""
@@ -17,63 +191,34 @@ def register():
         data = request.get_json()
         
         if not data:
-            return jsonify({
-                'success': False,
-                'message': 'No data provided'
-            }), 400
+            return _error('No data provided', 400)
         
         # Validate required fields
-        required_fields = ['email', 'password', 'first_name', 'last_name', 'user_type']
-        for field in required_fields:
-            if field not in data or not data[field]:
-                return jsonify({
-                    'success': False,
-                    'message': f'{field} is required'
-                }), 400
+        field_error = _check_register_fields(data)
+        if field_error:
+            return _error(field_error, 400)
         
         # Validate email
         email_validation = validate_email(data['email'])
         if not validate_email(data['email']):  # ✅ Direct boolean check
-            return jsonify({'success': False, 'message': 'Invalid email format'}), 400
-        
-        # Check if email already exists
-        existing_user = User.query.filter_by(email=data['email']).first()
-        if existing_user:
-            return jsonify({
-                'success': False,
-                'message': 'Email already registered'
-            }), 409
+            return _error('Invalid email format', 400)
         
         # Validate password
         password_validation = validate_password(data['password'])
         if not password_validation['valid']:
-            return jsonify({
-                'success': False,
-                'message': password_validation['message']
-            }), 400
+            return _error(password_validation['message'], 400)
         
         # Validate phone if provided
         if 'phone_number' in data and data['phone_number']:
             phone_validation = validate_phone(data['phone_number'])
             if not validate_phone(data['phone_number']):
-                return jsonify({'success': False, 'message': 'Invalid phone number format'}), 400
-            
-            # Check if phone already exists
-            existing_phone = User.query.filter_by(phone_number=data['phone_number']).first()
-            if existing_phone:
-                return jsonify({
-                    'success': False,
-                    'message': 'Phone number already registered'
-                }), 409
-        
+                return _error('Invalid phone number format', 400)
+
         # Validate user type
         try:
             user_type = UserType(data['user_type'])
         except ValueError:
-            return jsonify({
-                'success': False,
-                'message': 'Invalid user type'
-            }), 400
+            return _error('Invalid user type', 400)
         
         # Create user
         user = User(
@@ -86,30 +231,20 @@ def register():
         )
         user.set_password(data['password'])
         user.generate_verification_token()
-        
-        db.session.add(user)
-        db.session.flush()  # Get user ID
-        
+
         # Create pharmacy for sellers
         if user_type == UserType.SELLER:
             pharmacy_data = data.get('pharmacy')
             if not pharmacy_data:
-                return jsonify({
-                    'success': False,
-                    'message': 'Pharmacy information is required for sellers'
-                }), 400
+                return _error('Pharmacy information is required for sellers', 400)
             
             # Validate required pharmacy fields
-            pharmacy_required = ['name', 'district_id', 'address', 'phone']
-            for field in pharmacy_required:
-                if field not in pharmacy_data or not pharmacy_data[field]:
-                    return jsonify({
-                        'success': False,
-                        'message': f'Pharmacy {field} is required'
-                    }), 400
+            field_error = _check_pharmacy_fields(pharmacy_data)
+            if field_error:
+                return _error(field_error, 400)
             
             pharmacy = Pharmacy(
-                seller_id=user.id,
+                seller=user,
                 name=pharmacy_data['name'],
                 name_ar=pharmacy_data.get('name_ar'),
                 description=pharmacy_data.get('description'),
@@ -130,48 +265,53 @@ def register():
                 closing_time=pharmacy_data.get('closing_time'),
                 is_24_hours=pharmacy_data.get('is_24_hours', False)
             )
-            db.session.add(pharmacy)
-        
-        # Create address if provided
+
+        # Create address if provided; the model's columns are
+        # country/city/district/detailed_address plus coordinates, with
+        # district the only one that has no default
         if 'address' in data and data['address']:
             address_data = data['address']
+            if not address_data.get('district'):
+                return _error('Address district is required', 400)
             address = UserAddress(
-                user_id=user.id,
-                label=address_data.get('label', 'Home'),
-                address_line1=address_data['address_line1'],
-                address_line2=address_data.get('address_line2'),
-                district_id=address_data.get('district_id'),
-                phone=address_data.get('phone'),
-                is_default=True
+                user=user,
+                country=address_data.get('country', 'Yemen'),
+                city=address_data.get('city', 'Taiz'),
+                district=address_data['district'],
+                detailed_address=address_data.get('detailed_address'),
+                latitude=address_data.get('latitude'),
+                longitude=address_data.get('longitude'),
+                is_primary=True
             )
-            db.session.add(address)
-        
-        db.session.commit()
+
+        # Single flush at commit time; the unit of work orders the user,
+        # pharmacy and address INSERTs via the relationship wiring above.
+        # Duplicate email/phone surfaces here as a constraint violation
+        # instead of costing a pre-check SELECT (which was also racy
+        # under concurrent identical registrations).
+        db.session.add(user)
+        try:
+            db.session.commit()
+        except IntegrityError as e:
+            db.session.rollback()
+            if 'phone' in str(e.orig):
+                return _error('Phone number already registered', 409)
+            return _error('Email already registered', 409)
         
-        # Debug logging before sending email
         user_full_name = user.get_full_name
         verification_token = user.verification_token
-        print(f"DEBUG: About to send email to {user.email}")
-        print(f"DEBUG: User full name: '{user_full_name}'")
-        print(f"DEBUG: Verification token: '{verification_token}'")
-        print(f"DEBUG: Preferred language: '{user.preferred_language}'")
-        
-        # Send verification email with correct parameter order
-        try:
-            email_result = send_verification_email(
-                user_email=user.email,
-                user_name=user_full_name,  # This should be the actual name, not token
-                verification_token=verification_token,  # This should be the token
-                language=user.preferred_language
-            )
-            print(f"DEBUG: Email result: {email_result}")
-            if not email_result['success']:
-                # Log email failure but don't fail registration
-                print(f"Failed to send verification email: {email_result.get('error')}")
-        except Exception as e:
-            print(f"Error sending verification email: {str(e)}")
-            import traceback
-            traceback.print_exc()
+        logger.debug("Sending verification email to %s (language=%s)",
+                     user.email, user.preferred_language)
+        
+        # Send verification email off the request thread; failures are
+        # logged by the email executor and don't fail registration
+        send_email_async(
+            send_verification_email,
+            user_email=user.email,
+            user_name=user_full_name,
+            verification_token=verification_token,
+            language=user.preferred_language
+        )
         
         # Log audit action
         log_audit_action(
@@ -190,20 +330,15 @@ def register():
                 'email': user.email,
                 'first_name': user.first_name,
                 'last_name': user.last_name,
-                'user_type': user.user_type.value,
+                'user_type': _USERTYPE_STR[user.user_type],
                 'email_verified': user.email_verified
             }
         }), 201
         
     except Exception as e:
         db.session.rollback()
-        print(f"Registration error: {str(e)}")
-        import traceback
-        traceback.print_exc()
-        return jsonify({
-            'success': False,
-            'message': f'Registration failed: {str(e)}'
-        }), 500
+        logger.exception("Registration error")
+        return _error(f'Registration failed: {str(e)}', 500)
 
 @auth_bp.route('/verify-email', methods=['POST'])
 def verify_email():
@@ -212,44 +347,45 @@ def verify_email():
         data = request.get_json()
         
         if not data or 'token' not in data:
-            return jsonify({
-                'success': False,
-                'message': 'Verification token is required'
-            }), 400
-        
+            return _error('Verification token is required', 400)
+
         token = data['token']
-        
-        # Find user with this verification token
-        user = User.query.filter_by(verification_token=token).first()
-        
-        if not user:
-            return jsonify({
-                'success': False,
-                'message': 'Invalid or expired verification token'
-            }), 400
+        # Reject non-string tokens up front: filter_by(None) would match
+        # any already-verified user (cleared tokens are NULL) and the
+        # constant-time recheck below requires two strings
+        if not token or not isinstance(token, str):
+            return _error('Verification token is required', 400)
+
+        # Find user with this verification token; eager-load the pharmacy
+        # touched below so we don't fire a lazy load for it
+        user = User.query.options(
+            joinedload(User.pharmacy)
+        ).filter_by(verification_token=token).first()
+
+        # Constant-time recheck in Python so the comparison itself can't
+        # leak token bytes through timing
+        if not user or not hmac.compare_digest(user.verification_token, token):
+            return _error('Invalid or expired verification token', 400)
         
         # Check if already verified
         if user.is_verified:
-            return jsonify({
-                'success': False,
-                'message': 'Email is already verified'
-            }), 400
+            return _error('Email is already verified', 400)
         
-        # Verify the user
+        # Verify the user; updated_at is maintained by the model's onupdate hook
         user.is_verified = True
         user.verification_token = None  # Clear the token
-        user.updated_at = datetime.utcnow()
         if user.user_type == UserType.SELLER and user.pharmacy:
             user.pharmacy.is_verified = True
             user.pharmacy.verification_date = datetime.utcnow()
             user.pharmacy.status = PharmacyStatus.VERIFIED
-            user.pharmacy.updated_at = datetime.utcnow()
+
+        # Create access tokens for automatic login before committing so
+        # the auto-login path needs only this one commit
+        access_token = create_access_token(identity=str(user.id))
+        refresh_token = create_refresh_token(identity=str(user.id))
+
         db.session.commit()
         
-        # Create access tokens for automatic login
-        access_token = create_access_token(identity=user.id)
-        refresh_token = create_refresh_token(identity=user.id)
-        
         # Log audit action
         log_audit_action(
             user.id,
@@ -262,69 +398,56 @@ def verify_email():
         return jsonify({
             'success': True,
             'message': 'Email verified successfully',
-            'user': user.to_dict(),
+            'user': user.to_public_dict(),
             'access_token': access_token,
             'refresh_token': refresh_token
         }), 200
         
     except Exception as e:
         db.session.rollback()
-        print(f"Email verification error: {str(e)}")
-        return jsonify({
-            'success': False,
-            'message': 'Email verification failed'
-        }), 500
+        logger.exception("Email verification error")
+        return _error('Email verification failed', 500)
 
 @auth_bp.route('/login', methods=['POST'])
+@rate_limit(max_attempts=5, time_window=60)
 def login():
     """Login user"""
     try:
         data = request.get_json()
         
         if not data:
-            return jsonify({
-                'success': False,
-                'message': 'No data provided'
-            }), 400
+            return _error('No data provided', 400)
         
         # Validate required fields
         if 'email' not in data or 'password' not in data:
-            return jsonify({
-                'success': False,
-                'message': 'Email and password are required'
-            }), 400
+            return _error('Email and password are required', 400)
         
-        # Find user
+        # Find user; the lean response payload touches no relationships,
+        # so no eager-load options are needed here
         user = User.query.filter_by(email=data['email']).first()
         
-        if not user or not user.check_password(data['password']):
-            return jsonify({
-                'success': False,
-                'message': 'Invalid email or password'
-            }), 401
+        # Always run the KDF: against the real hash on a hit, against the
+        # dummy hash on a miss, so both paths cost the same
+        password_ok = check_password_hash(
+            user.password_hash if user else _DUMMY_HASH, data['password'])
+        if not user or not password_ok:
+            return _error('Invalid email or password', 401)
         
         # Check if user is active
         if not user.is_active:
-            return jsonify({
-                'success': False,
-                'message': 'Account is deactivated. Please contact support.'
-            }), 403
+            return _error('Account is deactivated. Please contact support.', 403)
         
         # Check if email is verified
         if not user.is_verified:
-            return jsonify({
-                'success': False,
-                'message': 'Please verify your email before logging in.',
-                'requires_verification': True
-            }), 403
-        
-        # Update last login
-        user.last_login = datetime.utcnow()
-        db.session.commit()
+            return _error('Please verify your email before logging in.', 403, requires_verification=True)
         
-        # Create access tokens
-        access_token = create_access_token(identity=user.id)
-        refresh_token = create_refresh_token(identity=user.id)
+        # Record last login off the request thread; the response doesn't
+        # depend on it so the tokens go out without waiting on the commit
+        _touch_last_login(user.id, datetime.utcnow())
+
+        # Create access tokens, reusing a recently issued one when possible
+        access_token = _access_token_for(user.id)
+        refresh_token = create_refresh_token(identity=str(user.id))
         
         # Log audit action
         log_audit_action(
@@ -338,28 +461,27 @@ def login():
         return jsonify({
             'success': True,
             'message': 'Login successful',
-            'user': user.to_dict(),
+            'user': user.to_public_dict(),
             'access_token': access_token,
             'refresh_token': refresh_token
         }), 200
         
     except Exception as e:
-        import traceback
-        traceback.print_exc()
-        print(f"Login error: {str(e)}")
-        print("Login request data:", data)
-        return jsonify({
-            'success': False,
-            'message': 'Login failed'
-        }), 500
+        logger.exception("Login error")
+        return _error('Login failed', 500)
 
 @auth_bp.route('/logout', methods=['POST'])
 @jwt_required()
 def logout():
     """Logout user"""
     try:
-        current_user_id = get_jwt_identity()
-        
+        current_user_id = int(get_jwt_identity())
+        _invalidate_user_state(current_user_id)
+
+        # Blocklist this token until its natural expiry
+        token = get_jwt()
+        revoke_token(token['jti'], token['exp'])
+
         # Log audit action
         log_audit_action(
             current_user_id,
@@ -375,27 +497,20 @@ def logout():
         }), 200
         
     except Exception as e:
-        return jsonify({
-            'success': False,
-            'message': 'Logout failed'
-        }), 500
+        return _error('Logout failed', 500)
 
 @auth_bp.route('/refresh', methods=['POST'])
 @jwt_required(refresh=True)
 def refresh():
     """Refresh access token"""
     try:
-        current_user_id = get_jwt_identity()
-        user = User.query.get(current_user_id)
-        
-        if not user or not user.is_active:
-            return jsonify({
-                'success': False,
-                'message': 'User not found or inactive'
-            }), 404
-        
+        current_user_id = int(get_jwt_identity())
+
+        if not _cached_is_active(current_user_id):
+            return _error('User not found or inactive', 404)
+
         # Create new access token
-        access_token = create_access_token(identity=current_user_id)
+        access_token = create_access_token(identity=str(current_user_id))
         
         return jsonify({
             'success': True,
@@ -403,61 +518,31 @@ def refresh():
         }), 200
         
     except Exception as e:
-        return jsonify({
-            'success': False,
-            'message': 'Token refresh failed'
-        }), 500
+        return _error('Token refresh failed', 500)
 
 @auth_bp.route('/forgot-password', methods=['POST'])
+@rate_limit(max_attempts=3, time_window=300)
 def forgot_password():
     """Send password reset email"""
     try:
         data = request.get_json()
         
         if not data or 'email' not in data:
-            return jsonify({
-                'success': False,
-                'message': 'Email is required'
-            }), 400
-        
-        user = User.query.filter_by(email=data['email']).first()
-        
-        if not user:
-            # Don't reveal if email exists or not
-            return jsonify({
-                'success': True,
-                'message': 'If the email exists, a password reset link has been sent.'
-            }), 200
-        
-        # Generate password reset token
-        user.password_reset_token = secrets.token_urlsafe(32)
-        user.password_reset_sent_at = datetime.utcnow()
-        db.session.commit()
-        
-        # Send password reset email
-        try:
-            email_result = send_password_reset_email(
-                user.email,
-                user.get_full_name(),
-                user.password_reset_token,
-                user.preferred_language
-            )
-            if not email_result['success']:
-                print(f"Failed to send password reset email: {email_result.get('error')}")
-        except Exception as e:
-            print(f"Error sending password reset email: {str(e)}")
-        
+            return _error('Email is required', 400)
+
+        # Accept immediately; the lookup, token signing and email send all
+        # run off the request thread, so the response takes the same time
+        # whether or not the account exists
+        _bg_writer.submit(
+            _forgot_password_bg, current_app._get_current_object(), data['email'])
+
         return jsonify({
             'success': True,
             'message': 'If the email exists, a password reset link has been sent.'
-        }), 200
-        
+        }), 202
+
     except Exception as e:
-        db.session.rollback()
-        return jsonify({
-            'success': False,
-            'message': 'Failed to process password reset request'
-        }), 500
+        return _error('Failed to process password reset request', 500)
 
 @auth_bp.route('/reset-password', methods=['POST'])
 def reset_password():
@@ -466,51 +551,41 @@ def reset_password():
         data = request.get_json()
         
         if not data:
-            return jsonify({
-                'success': False,
-                'message': 'No data provided'
-            }), 400
-        
-        required_fields = ['token', 'new_password']
-        for field in required_fields:
-            if field not in data or not data[field]:
-                return jsonify({
-                    'success': False,
-                    'message': f'{field} is required'
-                }), 400
-        
-        # Find user with reset token
-        user = User.query.filter_by(password_reset_token=data['token']).first()
-        
-        if not user:
-            return jsonify({
-                'success': False,
-                'message': 'Invalid or expired reset token'
-            }), 400
-        
-        # Check if token is expired (24 hours)
-        if user.password_reset_sent_at:
-            token_age = datetime.utcnow() - user.password_reset_sent_at
-            if token_age > timedelta(hours=24):
-                return jsonify({
-                    'success': False,
-                    'message': 'Reset token has expired'
-                }), 400
+            return _error('No data provided', 400)
+        
+        field_error = _check_reset_fields(data)
+        if field_error:
+            return _error(field_error, 400)
         
+        # Verify the signed token (HMAC check + embedded age), then fetch
+        # the user by primary key instead of scanning a token column
+        try:
+            user_id, generation = _get_reset_serializer().loads(
+                data['token'], max_age=_RESET_TOKEN_MAX_AGE)
+        except SignatureExpired:
+            return _error('Reset token has expired', 400)
+        except (BadSignature, ValueError):
+            return _error('Invalid or expired reset token', 400)
+
+        # Primary-key fetch restricted to the columns this handler touches
+        user = db.session.get(
+            User, user_id,
+            options=(load_only(User.email, User.password_reset_generation),))
+        if not user or user.password_reset_generation != generation:
+            return _error('Invalid or expired reset token', 400)
+
         # Validate new password
         password_validation = validate_password(data['new_password'])
         if not password_validation['valid']:
-            return jsonify({
-                'success': False,
-                'message': password_validation['message']
-            }), 400
+            return _error(password_validation['message'], 400)
         
-        # Update password
+        # Update password; bumping the generation invalidates any other
+        # reset tokens still outstanding for this account
         user.set_password(data['new_password'])
-        user.password_reset_token = None
-        user.password_reset_sent_at = None
-        user.updated_at = datetime.utcnow()
+        user.password_reset_generation += 1
         db.session.commit()
+
+        _invalidate_user_state(user.id)
         
         # Log audit action
         log_audit_action(
@@ -528,107 +603,34 @@ def reset_password():
         
     except Exception as e:
         db.session.rollback()
-        return jsonify({
-            'success': False,
-            'message': 'Password reset failed'
-        }), 500
+        return _error('Password reset failed', 500)
 
 @auth_bp.route('/resend-verification', methods=['POST'])
+@rate_limit(max_attempts=3, time_window=300)
 def resend_verification():
     """Resend email verification"""
     try:
         data = request.get_json()
         
         if not data or 'email' not in data:
-            return jsonify({
-                'success': False,
-                'message': 'Email is required'
-            }), 400
+            return _error('Email is required', 400)
         
         # Validate email format
         if not validate_email(data['email']):
-            return jsonify({
-                'success': False,
-                'message': 'Invalid email format'
-            }), 400
-        
-        # Find user by email
-        user = User.query.filter_by(email=data['email']).first()
-        if not user:
-            # Don't reveal if email exists or not for security
-            return jsonify({
-                'success': True,
-                'message': 'If the email exists and is not verified, a verification email will be sent'
-            }), 200
-        
-        # Check if user is already verified
-        if user.is_verified:
-            return jsonify({
-                'success': False,
-                'message': 'Email is already verified'
-            }), 400
-        
-        # Generate new verification token
-        user.generate_verification_token()
-        db.session.commit()
-        
-        # Debug logging before sending email
-        user_full_name = user.get_full_name()
-        verification_token = user.verification_token
-        print(f"DEBUG: About to resend email to {user.email}")
-        print(f"DEBUG: User full name: '{user_full_name}'")
-        print(f"DEBUG: Verification token: '{verification_token}'")
-        print(f"DEBUG: Preferred language: '{user.preferred_language}'")
-        
-        # Send verification email
-        try:
-            email_result = send_verification_email(
-                user_email=user.email,
-                user_name=user_full_name,
-                verification_token=verification_token,
-                language=user.preferred_language
-            )
-            
-            print(f"DEBUG: Email result: {email_result}")
-            
-            if not email_result.get('success', False):
-                current_app.logger.error(f"Failed to send verification email: {email_result}")
-                return jsonify({
-                    'success': False,
-                    'message': 'Failed to send verification email'
-                }), 500
-                
-        except Exception as email_error:
-            current_app.logger.error(f"Email sending error: {str(email_error)}")
-            import traceback
-            traceback.print_exc()
-            return jsonify({
-                'success': False,
-                'message': 'Failed to send verification email'
-            }), 500
-        
-        # Log audit action
-        log_audit_action(
-            user.id,
-            'verification_email_resent',
-            'user',
-            user.id,
-            f"Verification email resent for {user.email}"
-        )
-        
+            return _error('Invalid email format', 400)
+
+        # Accept immediately; lookup, token rotation and email send happen
+        # in the background so the response never reveals (by timing or
+        # status) whether the account exists or is already verified
+        _bg_writer.submit(
+            _resend_verification_bg, current_app._get_current_object(), data['email'])
+
         return jsonify({
             'success': True,
-            'message': 'Verification email sent successfully'
-        }), 200
-        
+            'message': 'If the email exists and is not verified, a verification email will be sent'
+        }), 202
+
     except Exception as e:
-        db.session.rollback()
-        current_app.logger.error(f"Resend verification error: {str(e)}")
-        import traceback
-        traceback.print_exc()
-        return jsonify({
-            'success': False,
-            'message': 'Failed to resend verification email'
-        }), 500
+        return _error('Failed to resend verification email', 500)
 
 
@@ -1,12 +1,38 @@
 from flask import Blueprint, request, jsonify, current_app
 from flask_jwt_extended import jwt_required
+from sqlalchemy import update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import joinedload, selectinload
 
-from src.models import db, ShoppingCart, CartItem, Product, Pharmacy
+from src.models import db, ShoppingCart, CartItem, Product, Pharmacy, PharmacyProduct
 from src.utils.auth import get_current_user, log_audit_action, require_customer
 from src.utils.validation import validate_required_fields, validate_quantity
 
 cart_bp = Blueprint('cart', __name__)
 
+# Serialized product/listing payloads keyed by (kind, id, updated_at);
+# an updated row gets a new key, so stale entries simply stop being hit
+# and no write-path invalidation is needed
+_serialized_cache = {}
+
+def _cached_to_dict(kind, obj):
+    """Return obj.to_dict(), memoized until the row's updated_at changes"""
+    key = (kind, obj.id, obj.updated_at)
+    cached = _serialized_cache.get(key)
+    if cached is None:
+        if len(_serialized_cache) > 4096:
+            _serialized_cache.clear()
+        cached = _serialized_cache[key] = obj.to_dict()
+    return cached
+
+def _cart_insert():
+    """Dialect-matched INSERT construct so ON CONFLICT works on the dev
+    sqlite database as well as Postgres"""
+    if db.engine.dialect.name == 'sqlite':
+        return sqlite_insert(CartItem)
+    return pg_insert(CartItem)
+
 @cart_bp.route('/', methods=['GET'])
 @require_customer
 def get_cart():
@@ -14,13 +40,22 @@ def get_cart():
     try:
         user = get_current_user()
         
-        # Get or create cart
-        cart = ShoppingCart.query.filter_by(user_id=user.id).first()
+        # Get or create cart; preload items with their listing, pharmacy
+        # and product in a fixed number of queries instead of 3 lazy
+        # SELECTs per cart row
+        cart = ShoppingCart.query.options(
+            selectinload(ShoppingCart.items)
+            .joinedload(CartItem.pharmacy_product)
+            .options(
+                joinedload(PharmacyProduct.pharmacy),
+                joinedload(PharmacyProduct.product)
+            )
+        ).filter_by(user_id=user.id).first()
         if not cart:
             cart = ShoppingCart(user_id=user.id)
             db.session.add(cart)
             db.session.commit()
-        
+
         # Group items by pharmacy
         pharmacy_groups = {}
         total_amount = 0
@@ -34,27 +69,29 @@ def get_cart():
                 pharmacy_groups[pharmacy_id] = {
                     'pharmacy': {
                         'id': pharmacy.id,
-                        'pharmacy_name': pharmacy.pharmacy_name,
-                        'pharmacy_name_ar': pharmacy.pharmacy_name_ar,
-                        'district': pharmacy.district,
-                        'phone_number': pharmacy.phone_number
+                        'pharmacy_name': pharmacy.name,
+                        'pharmacy_name_ar': pharmacy.name_ar,
+                        'district_id': pharmacy.district_id,
+                        'phone_number': pharmacy.phone
                     },
                     'items': [],
                     'subtotal': 0
                 }
             
-            # Format item data
+            # Compute the line total once and reuse it for the item, the
+            # pharmacy subtotal and the cart total
+            line_total = item.get_total_price()
             item_data = {
                 'id': item.id,
                 'quantity': item.quantity,
-                'total_price': item.get_total_price(),
-                'pharmacy_product': item.pharmacy_product.to_dict(),
-                'product': item.pharmacy_product.product.to_dict()
+                'total_price': line_total,
+                'pharmacy_product': _cached_to_dict('listing', item.pharmacy_product),
+                'product': _cached_to_dict('product', item.pharmacy_product.product)
             }
-            
+
             pharmacy_groups[pharmacy_id]['items'].append(item_data)
-            pharmacy_groups[pharmacy_id]['subtotal'] += item.get_total_price()
-            total_amount += item.get_total_price()
+            pharmacy_groups[pharmacy_id]['subtotal'] += line_total
+            total_amount += line_total
             total_items += item.quantity
         
         return jsonify({
@@ -98,8 +135,11 @@ def add_to_cart():
         if quantity <= 0:
             return jsonify({'error': 'Quantity must be greater than 0'}), 400
         
-        # Validate pharmacy product
-        pharmacy_product = PharmacyProduct.query.get(data['pharmacy_product_id'])
+        # Validate pharmacy product; pull its product row in the same
+        # query since the upsert snapshots the product name from it
+        pharmacy_product = PharmacyProduct.query.options(
+            joinedload(PharmacyProduct.product)
+        ).get(data['pharmacy_product_id'])
         if not pharmacy_product:
             return jsonify({'error': 'Product not found'}), 404
         
@@ -116,57 +156,55 @@ def add_to_cart():
             db.session.add(cart)
             db.session.flush()
         
-        # Check if item already exists in cart
-        existing_item = CartItem.query.filter_by(
+        # Atomic upsert against the (cart_id, pharmacy_product_id) unique
+        # constraint: one statement inserts the line or bumps its quantity,
+        # closing the check-then-insert race and saving a round-trip
+        cart_items = CartItem.__table__
+        stmt = _cart_insert().values(
             cart_id=cart.id,
-            pharmacy_product_id=data['pharmacy_product_id']
-        ).first()
-        
-        if existing_item:
-            # Update quantity
-            new_quantity = existing_item.quantity + quantity
-            if not pharmacy_product.can_order_quantity(new_quantity):
-                return jsonify({'error': f'Cannot add {quantity} more items. Current in cart: {existing_item.quantity}, Available: {pharmacy_product.quantity_available}'}), 400
-            
-            old_values = {'quantity': existing_item.quantity}
-            existing_item.quantity = new_quantity
-            
-            db.session.commit()
-            
-            # Log audit action
-            log_audit_action(user.id, 'cart_item_updated', 'cart_items', existing_item.id, old_values, {'quantity': new_quantity})
-            
-            return jsonify({
-                'message': 'Cart item updated successfully',
-                'item': {
-                    'id': existing_item.id,
-                    'quantity': existing_item.quantity,
-                    'total_price': existing_item.get_total_price()
-                }
-            }), 200
-        else:
-            # Create new cart item
-            cart_item = CartItem(
-                cart_id=cart.id,
-                pharmacy_product_id=data['pharmacy_product_id'],
-                quantity=quantity
-            )
-            
-            db.session.add(cart_item)
-            db.session.commit()
-            
-            # Log audit action
-            log_audit_action(user.id, 'cart_item_added', 'cart_items', cart_item.id, {}, cart_item.to_dict())
-            
-            return jsonify({
-                'message': 'Item added to cart successfully',
-                'item': {
-                    'id': cart_item.id,
-                    'quantity': cart_item.quantity,
-                    'total_price': cart_item.get_total_price()
-                }
-            }), 201
-        
+            pharmacy_product_id=pharmacy_product.id,
+            product_id=pharmacy_product.product_id,
+            pharmacy_id=pharmacy_product.pharmacy_id,
+            product_name=pharmacy_product.product.name,
+            product_name_ar=pharmacy_product.product.name_ar,
+            quantity=quantity,
+            unit_price=pharmacy_product.price,
+            total_price=quantity * pharmacy_product.price
+        )
+        stmt = stmt.on_conflict_do_update(
+            index_elements=['cart_id', 'pharmacy_product_id'],
+            set_={
+                'quantity': cart_items.c.quantity + stmt.excluded.quantity,
+                'total_price': (cart_items.c.quantity + stmt.excluded.quantity) * cart_items.c.unit_price
+            }
+        ).returning(CartItem.id, CartItem.quantity, CartItem.total_price)
+
+        row = db.session.execute(stmt).one()
+
+        # Enforce stock/order limits on the post-upsert quantity; roll the
+        # statement back rather than racing a separate pre-check
+        if not pharmacy_product.can_order_quantity(row.quantity):
+            db.session.rollback()
+            return jsonify({'error': f'Cannot order {row.quantity} items. Available: {pharmacy_product.quantity_available}'}), 400
+
+        db.session.commit()
+
+        created = row.quantity == quantity
+        log_audit_action(
+            user.id,
+            'cart_item_added' if created else 'cart_item_updated',
+            'cart_items', row.id, {}, {'quantity': row.quantity}
+        )
+
+        return jsonify({
+            'message': 'Item added to cart successfully' if created else 'Cart item updated successfully',
+            'item': {
+                'id': row.id,
+                'quantity': row.quantity,
+                'total_price': float(row.total_price) if row.total_price else 0.0
+            }
+        }), 201 if created else 200
+
     except Exception as e:
         db.session.rollback()
         current_app.logger.error(f"Add to cart error: {str(e)}")
@@ -192,34 +230,60 @@ def update_cart_item(cart_item_id):
         if quantity <= 0:
             return jsonify({'error': 'Quantity must be greater than 0'}), 400
         
-        # Get cart item
-        cart_item = CartItem.query.join(ShoppingCart).filter(
-            CartItem.id == cart_item_id,
-            ShoppingCart.user_id == user.id
+        # Single guarded UPDATE: ownership and the stock/order limits are
+        # all predicates on the statement, so the happy path is one
+        # round-trip with no ORM hydration
+        stock_ok = (
+            db.session.query(PharmacyProduct.id)
+            .filter(
+                PharmacyProduct.id == CartItem.pharmacy_product_id,
+                PharmacyProduct.is_available.is_(True),
+                PharmacyProduct.quantity_available >= quantity,
+                db.or_(PharmacyProduct.minimum_quantity.is_(None),
+                       PharmacyProduct.minimum_quantity <= quantity),
+                db.or_(PharmacyProduct.maximum_quantity.is_(None),
+                       PharmacyProduct.maximum_quantity >= quantity)
+            ).exists()
+        )
+        row = db.session.execute(
+            update(CartItem)
+            .where(
+                CartItem.id == cart_item_id,
+                CartItem.cart_id == db.session.query(ShoppingCart.id)
+                .filter_by(user_id=user.id).scalar_subquery(),
+                stock_ok
+            )
+            .values(quantity=quantity,
+                    total_price=quantity * CartItem.__table__.c.unit_price)
+            .returning(CartItem.id, CartItem.quantity, CartItem.total_price)
         ).first()
-        
-        if not cart_item:
-            return jsonify({'error': 'Cart item not found'}), 404
-        
-        # Check if quantity is available
-        if not cart_item.pharmacy_product.can_order_quantity(quantity):
-            return jsonify({'error': f'Cannot order {quantity} items. Available: {cart_item.pharmacy_product.quantity_available}'}), 400
-        
-        # Update quantity
-        old_values = {'quantity': cart_item.quantity}
-        cart_item.quantity = quantity
-        
+
+        if row is None:
+            db.session.rollback()
+            # Miss path only: work out whether the item was missing or the
+            # quantity was the problem
+            listing = (
+                db.session.query(PharmacyProduct)
+                .join(CartItem, CartItem.pharmacy_product_id == PharmacyProduct.id)
+                .join(ShoppingCart, CartItem.cart_id == ShoppingCart.id)
+                .filter(CartItem.id == cart_item_id, ShoppingCart.user_id == user.id)
+                .first()
+            )
+            if listing is None:
+                return jsonify({'error': 'Cart item not found'}), 404
+            return jsonify({'error': f'Cannot order {quantity} items. Available: {listing.quantity_available}'}), 400
+
         db.session.commit()
-        
+
         # Log audit action
-        log_audit_action(user.id, 'cart_item_updated', 'cart_items', cart_item.id, old_values, {'quantity': quantity})
-        
+        log_audit_action(user.id, 'cart_item_updated', 'cart_items', row.id, {}, {'quantity': row.quantity})
+
         return jsonify({
             'message': 'Cart item updated successfully',
             'item': {
-                'id': cart_item.id,
-                'quantity': cart_item.quantity,
-                'total_price': cart_item.get_total_price()
+                'id': row.id,
+                'quantity': row.quantity,
+                'total_price': float(row.total_price) if row.total_price else 0.0
             }
         }), 200
         
@@ -268,18 +332,20 @@ def clear_cart():
     """Clear entire shopping cart"""
     try:
         user = get_current_user()
-        
-        # Get cart
-        cart = ShoppingCart.query.filter_by(user_id=user.id).first()
-        if not cart:
-            return jsonify({'message': 'Cart is already empty'}), 200
-        
-        # Remove all items
-        CartItem.query.filter_by(cart_id=cart.id).delete()
+
+        # One DELETE keyed through a scalar subquery on the user's cart;
+        # no SELECT or ORM hydration just to learn the cart id
+        deleted = CartItem.query.filter(
+            CartItem.cart_id == db.session.query(ShoppingCart.id)
+            .filter_by(user_id=user.id).scalar_subquery()
+        ).delete(synchronize_session=False)
         db.session.commit()
-        
+
+        if not deleted:
+            return jsonify({'message': 'Cart is already empty'}), 200
+
         # Log audit action
-        log_audit_action(user.id, 'cart_cleared', 'shopping_carts', cart.id, {}, {})
+        log_audit_action(user.id, 'cart_cleared', 'shopping_carts', None, {}, {'items_removed': deleted})
         
         return jsonify({
             'message': 'Cart cleared successfully'
@@ -296,16 +362,15 @@ def get_cart_count():
     """Get cart item count"""
     try:
         user = get_current_user()
-        
-        # Get cart
-        cart = ShoppingCart.query.filter_by(user_id=user.id).first()
-        if not cart:
-            return jsonify({'count': 0}), 200
-        
-        total_items = sum(item.quantity for item in cart.items)
-        
+
+        # Sum in SQL: one round-trip returning a single integer instead
+        # of hydrating every cart item; a missing cart coalesces to 0
+        total_items = db.session.query(
+            db.func.coalesce(db.func.sum(CartItem.quantity), 0)
+        ).join(ShoppingCart).filter(ShoppingCart.user_id == user.id).scalar()
+
         return jsonify({
-            'count': total_items
+            'count': int(total_items)
         }), 200
         
     except Exception as e:
@@ -1,14 +1,68 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, Response, current_app, request, jsonify, stream_with_context
 from flask_jwt_extended import jwt_required
 from datetime import datetime
+import time
 
-from src.models import db, Order, OrderItem, ShoppingCart, CartItem, OrderStatus, PaymentMethod, PaymentStatus
-from src.utils.auth import get_current_user, log_audit_action, require_customer, require_seller_or_admin, can_access_order
+import orjson
+
+from src.models import db, Order, OrderItem, ShoppingCart, CartItem, DeliveryMethod, OrderStatus, PaymentMethod, PaymentStatus, PharmacyProduct
+from src.utils.auth import get_current_user, get_redis, get_seller_pharmacy_id, log_audit_action, require_customer, require_seller_or_admin, can_access_order
 from src.utils.validation import validate_required_fields, validate_order_status, validate_payment_method, sanitize_string
-from src.utils.email import send_order_confirmation_email
+from src.utils.email import send_email_async, send_order_confirmation_email
 
 orders_bp = Blueprint('orders', __name__)
 
+# Serialized order payloads keyed by (id, updated_at): every mutation
+# bumps updated_at, so a key can never serve stale bytes and no write
+# path needs to invalidate anything. Redis when configured, bounded
+# in-process dict otherwise
+_ORDER_CACHE_TTL = 300  # seconds
+_order_cache = {}
+
+# Value -> member maps for request validation; a dict miss is an O(1)
+# check where OrderStatus(value) costs an exception per bad input
+_ORDER_STATUS_BY_VALUE = {s.value: s for s in OrderStatus}
+_PAYMENT_METHOD_BY_VALUE = {m.value: m for m in PaymentMethod}
+_DELIVERY_METHOD_BY_VALUE = {m.value: m for m in DeliveryMethod}
+
+def _order_summary(order):
+    """Minimal mutation-response payload
+
+    Write paths only need to confirm the new state; clients re-fetch
+    full details via get_order, which the updated_at-keyed cache makes
+    cheap. Skips the full to_dict per mutation.
+    """
+    return {
+        'id': order.id,
+        'order_number': order.order_number,
+        'status': order.status.value if order.status else None,
+        'updated_at': order.updated_at
+    }
+
+def _get_cached_order(cache_key):
+    client = get_redis()
+    if client is not None:
+        try:
+            return client.get(cache_key)
+        except Exception as e:
+            current_app.logger.error(f"Order cache read failed: {str(e)}")
+    cached = _order_cache.get(cache_key)
+    if cached and cached[0] > time.monotonic():
+        return cached[1]
+    return None
+
+def _store_order(cache_key, body):
+    client = get_redis()
+    if client is not None:
+        try:
+            client.setex(cache_key, _ORDER_CACHE_TTL, body)
+            return
+        except Exception as e:
+            current_app.logger.error(f"Order cache write failed: {str(e)}")
+    if len(_order_cache) > 4096:
+        _order_cache.clear()
+    _order_cache[cache_key] = (time.monotonic() + _ORDER_CACHE_TTL, body)
+
 @orders_bp.route('/', methods=['POST'])
 @require_customer
 def create_order():
@@ -31,7 +85,23 @@ def create_order():
                 'success': False,
                 'message': validation_result['message']
             }), 400
-        
+
+        # Reject bad payment methods with a dict lookup before any DB
+        # work; previously this surfaced as a 500 from enum coercion
+        payment_method = _PAYMENT_METHOD_BY_VALUE.get(data['payment_method'])
+        if payment_method is None:
+            return jsonify({
+                'success': False,
+                'message': 'Invalid payment method'
+            }), 400
+
+        delivery_method = _DELIVERY_METHOD_BY_VALUE.get(data['delivery_method'])
+        if delivery_method is None:
+            return jsonify({
+                'success': False,
+                'message': 'Invalid delivery method'
+            }), 400
+
         # Get user's cart
         cart = ShoppingCart.query.filter_by(user_id=user.id).first()
         if not cart or not cart.items:
@@ -47,13 +117,41 @@ def create_order():
                 'success': False,
                 'message': 'No items found for this pharmacy'
             }), 400
-        
+
+        # Lock and validate stock for every ordered listing in one
+        # SELECT ... FOR UPDATE; the row locks hold until the final
+        # commit, so a concurrent order can't oversell between the check
+        # and the decrement. Legacy lines without a listing id are skipped
+        listing_qty = {}
+        for cart_item in pharmacy_items:
+            if cart_item.pharmacy_product_id is not None:
+                listing_qty[cart_item.pharmacy_product_id] = (
+                    listing_qty.get(cart_item.pharmacy_product_id, 0) + cart_item.quantity
+                )
+        if listing_qty:
+            available = dict(db.session.execute(
+                db.select(PharmacyProduct.id, PharmacyProduct.quantity_available)
+                .where(PharmacyProduct.id.in_(listing_qty))
+                .with_for_update()
+            ).all())
+            for cart_item in pharmacy_items:
+                listing_id = cart_item.pharmacy_product_id
+                if listing_id is None:
+                    continue
+                if available.get(listing_id, 0) < listing_qty[listing_id]:
+                    db.session.rollback()
+                    return jsonify({
+                        'success': False,
+                        'message': f'Insufficient stock for {cart_item.product_name}'
+                    }), 400
+
+
         # Create order
         order = Order(
             customer_id=user.id,
             pharmacy_id=data['pharmacy_id'],
-            delivery_method=data['delivery_method'],
-            payment_method=data['payment_method'],
+            delivery_method=delivery_method,
+            payment_method=payment_method,
             delivery_address=sanitize_string(data.get('delivery_address')),
             delivery_phone=sanitize_string(data.get('delivery_phone')),
             delivery_notes=sanitize_string(data.get('delivery_notes')),
@@ -63,51 +161,69 @@ def create_order():
         # Generate order number
         order.order_number = order.generate_order_number()
         
-        # Add order items
+        # Build the item rows up front so they go to the database as one
+        # multi-row INSERT instead of a round-trip per cart line
         subtotal = 0
+        items_payload = []
         for cart_item in pharmacy_items:
-            order_item = OrderItem(
-                product_id=cart_item.product_id,
-                product_name=cart_item.product_name,
-                product_name_ar=cart_item.product_name_ar,
-                quantity=cart_item.quantity,
-                unit_price=cart_item.unit_price
-            )
-            order_item.calculate_total()
-            order.items.append(order_item)
-            subtotal += order_item.total_price
-        
+            line_total = cart_item.quantity * cart_item.unit_price
+            subtotal += line_total
+            items_payload.append({
+                'product_id': cart_item.product_id,
+                'product_name': cart_item.product_name,
+                'product_name_ar': cart_item.product_name_ar,
+                'quantity': cart_item.quantity,
+                'unit_price': cart_item.unit_price,
+                'total_price': line_total
+            })
+
         # Calculate totals
         order.subtotal = subtotal
         order.delivery_fee = data.get('delivery_fee', 0)
         order.tax_amount = data.get('tax_amount', 0)
         order.discount_amount = data.get('discount_amount', 0)
-        order.calculate_totals()
-        
-        # Save order
+        order.total_amount = order.subtotal + order.tax_amount + order.delivery_fee - order.discount_amount
+
+        # Save order, then bulk-insert its items against the assigned id
         db.session.add(order)
-        db.session.commit()
-        
-        # Remove items from cart
-        for cart_item in pharmacy_items:
-            db.session.delete(cart_item)
-        cart.calculate_totals()
-        db.session.commit()
-        
-        # Send order confirmation email
-        try:
-            email_result = send_order_confirmation_email(
-                user.email,
-                user.get_full_name(),
-                order.to_dict(),
-                user.preferred_language
+        db.session.flush()
+        for row in items_payload:
+            row['order_id'] = order.id
+        db.session.execute(OrderItem.__table__.insert(), items_payload)
+
+        # Decrement the locked stock rows with one executemany UPDATE
+        if listing_qty:
+            db.session.execute(
+                PharmacyProduct.__table__.update()
+                .where(PharmacyProduct.id == db.bindparam('listing_id'))
+                .values(quantity_available=PharmacyProduct.quantity_available - db.bindparam('qty')),
+                [{'listing_id': listing_id, 'qty': qty} for listing_id, qty in listing_qty.items()]
             )
-            if not email_result['success']:
-                # Log email failure but don't fail the order
-                print(f"Failed to send order confirmation email: {email_result.get('error')}")
-        except Exception as e:
-            print(f"Error sending order confirmation email: {str(e)}")
+
+        # Remove the ordered lines with one DELETE, then refresh the cart
+        # totals from a single SQL aggregate over what's left
+        CartItem.query.filter(
+            CartItem.id.in_([ci.id for ci in pharmacy_items])
+        ).delete(synchronize_session=False)
+        cart.total_items, cart.total_amount = db.session.query(
+            db.func.coalesce(db.func.sum(CartItem.quantity), 0),
+            db.func.coalesce(db.func.sum(CartItem.total_price), 0)
+        ).filter(CartItem.cart_id == cart.id).one()
+
+        # One commit covers order, items and cart cleanup: a single fsync,
+        # and a crash can't leave the order placed but the cart intact
+        db.session.commit()
         
+        # Send order confirmation off the request thread; the response
+        # doesn't wait on SMTP and failures are logged by the executor
+        send_email_async(
+            send_order_confirmation_email,
+            user.email,
+            user.get_full_name,
+            order.to_dict(),
+            user.preferred_language
+        )
+
         # Log audit action
         log_audit_action(
             user.id,
@@ -144,44 +260,92 @@ def get_orders():
         if user.user_type.value == 'customer':
             query = Order.query.filter_by(customer_id=user.id)
         elif user.user_type.value == 'seller':
-            # Get orders for seller's pharmacy
-            from src.models import Pharmacy
-            pharmacy = Pharmacy.query.filter_by(seller_id=user.id).first()
-            if not pharmacy:
+            # Cached seller -> pharmacy id lookup; no Pharmacy row fetch
+            pharmacy_id = get_seller_pharmacy_id(user.id)
+            if pharmacy_id is None:
                 return jsonify({
                     'success': False,
                     'message': 'No pharmacy found for this seller'
                 }), 404
-            query = Order.query.filter_by(pharmacy_id=pharmacy.id)
+            query = Order.query.filter_by(pharmacy_id=pharmacy_id)
         else:  # admin
             query = Order.query
         
         # Filter by status if provided
         if status:
-            try:
-                status_enum = OrderStatus(status)
-                query = query.filter_by(status=status_enum)
-            except ValueError:
+            status_enum = _ORDER_STATUS_BY_VALUE.get(status)
+            if status_enum is None:
                 return jsonify({
                     'success': False,
                     'message': 'Invalid order status'
                 }), 400
+            query = query.filter_by(status=status_enum)
         
-        # Paginate results
-        orders = query.order_by(Order.created_at.desc()).paginate(
+        ordered = query.order_by(Order.created_at.desc(), Order.id.desc())
+
+        # Keyset pagination: ?after=<created_at_iso>,<id> walks the
+        # (created_at, id) index in bounded steps with no COUNT and no
+        # O(offset) scan, so deep pages cost the same as the first
+        after = request.args.get('after')
+        if after is not None:
+            try:
+                after_ts_raw, after_id_raw = after.rsplit(',', 1)
+                after_ts = datetime.fromisoformat(after_ts_raw)
+                after_id = int(after_id_raw)
+            except ValueError:
+                return jsonify({
+                    'success': False,
+                    'message': 'Invalid cursor'
+                }), 400
+
+            rows = ordered.filter(
+                db.or_(
+                    Order.created_at < after_ts,
+                    db.and_(Order.created_at == after_ts, Order.id < after_id)
+                )
+            ).limit(per_page + 1).all()
+
+            has_more = len(rows) > per_page
+            rows = rows[:per_page]
+            next_cursor = f"{rows[-1].created_at.isoformat()},{rows[-1].id}" if has_more else None
+
+            return jsonify({
+                'success': True,
+                'orders': [order.to_dict() for order in rows],
+                'pagination': {
+                    'per_page': per_page,
+                    'next_cursor': next_cursor,
+                    'has_more': has_more
+                }
+            })
+
+        # Page-numbered fallback for existing clients
+        orders = ordered.paginate(
             page=page, per_page=per_page, error_out=False
         )
-        
-        return jsonify({
-            'success': True,
-            'orders': [order.to_dict() for order in orders.items],
-            'pagination': {
-                'page': page,
-                'pages': orders.pages,
-                'per_page': per_page,
-                'total': orders.total
-            }
-        })
+
+        pagination_payload = {
+            'page': page,
+            'pages': orders.pages,
+            'per_page': per_page,
+            'total': orders.total
+        }
+
+        # Stream the page instead of materializing a list of dicts plus
+        # the full response body; each order is serialized and written as
+        # it is reached, so peak memory stays flat at any per_page
+        def generate(rows):
+            yield b'{"success":true,"orders":['
+            sep = b''
+            for order in rows:
+                yield sep + orjson.dumps(order.to_dict())
+                sep = b','
+            yield b'],"pagination":' + orjson.dumps(pagination_payload) + b'}'
+
+        return Response(
+            stream_with_context(generate(orders.items)),
+            mimetype='application/json'
+        )
         
     except Exception as e:
         return jsonify({
@@ -195,19 +359,37 @@ def get_order(order_id):
     """Get specific order details"""
     try:
         user = get_current_user()
-        order = Order.query.get_or_404(order_id)
-        
-        # Check access permissions
-        if not can_access_order(user, order):
+
+        # Same narrow pre-check as the mutation handlers: a 404 or 403
+        # costs one three-column lookup, never a full row hydration
+        row = db.session.execute(
+            db.select(Order.id, Order.customer_id, Order.pharmacy_id, Order.updated_at)
+            .filter_by(id=order_id)
+        ).first()
+        if row is None:
+            return jsonify({
+                'success': False,
+                'message': 'Order not found'
+            }), 404
+
+        if not can_access_order(user, row):
             return jsonify({
                 'success': False,
                 'message': 'Access denied'
             }), 403
-        
-        return jsonify({
-            'success': True,
-            'order': order.to_dict()
-        })
+
+        # Serve hot orders from cached bytes; the key's updated_at
+        # component makes mutations roll the key forward automatically
+        cache_key = f'order:{order_id}:{row.updated_at.timestamp()}'
+        cached = _get_cached_order(cache_key)
+        if cached is not None:
+            return current_app.response_class(cached, mimetype='application/json')
+
+        order = db.session.get(Order, order_id)
+        body = current_app.json.dumps({'success': True, 'order': order.to_dict()})
+        _store_order(cache_key, body)
+
+        return current_app.response_class(body, mimetype='application/json')
         
     except Exception as e:
         return jsonify({
@@ -221,34 +403,45 @@ def update_order_status(order_id):
     """Update order status"""
     try:
         user = get_current_user()
-        order = Order.query.get_or_404(order_id)
         data = request.get_json()
-        
+
         if not data or 'status' not in data:
             return jsonify({
                 'success': False,
                 'message': 'Status is required'
             }), 400
-        
+
         # Validate status
-        try:
-            new_status = OrderStatus(data['status'])
-        except ValueError:
+        new_status = _ORDER_STATUS_BY_VALUE.get(data['status'])
+        if new_status is None:
             return jsonify({
                 'success': False,
                 'message': 'Invalid order status'
             }), 400
-        
+
+        # Permission check runs on a two-column fetch; the reject path
+        # never hydrates the full order row
+        row = db.session.execute(
+            db.select(Order.id, Order.pharmacy_id).filter_by(id=order_id)
+        ).first()
+        if row is None:
+            return jsonify({
+                'success': False,
+                'message': 'Order not found'
+            }), 404
+
         # Check permissions for sellers
         if user.user_type.value == 'seller':
-            from src.models import Pharmacy
-            pharmacy = Pharmacy.query.filter_by(seller_id=user.id).first()
-            if not pharmacy or order.pharmacy_id != pharmacy.id:
+            pharmacy_id = get_seller_pharmacy_id(user.id)
+            if pharmacy_id is None or row.pharmacy_id != pharmacy_id:
                 return jsonify({
                     'success': False,
                     'message': 'Access denied'
                 }), 403
-        
+
+        # Authorized: now load the full object for the mutation path
+        order = db.session.get(Order, order_id)
+
         # Update status
         old_status = order.status
         order.status = new_status
@@ -271,7 +464,7 @@ def update_order_status(order_id):
         return jsonify({
             'success': True,
             'message': 'Order status updated successfully',
-            'order': order.to_dict()
+            'order': _order_summary(order)
         })
         
     except Exception as e:
@@ -287,16 +480,27 @@ def cancel_order(order_id):
     """Cancel an order"""
     try:
         user = get_current_user()
-        order = Order.query.get_or_404(order_id)
         data = request.get_json() or {}
-        
-        # Check access permissions
-        if not can_access_order(user, order):
+
+        # Access check against a three-column fetch; unauthorized callers
+        # cost one narrow index lookup instead of a full row plus lazy loads
+        row = db.session.execute(
+            db.select(Order.id, Order.customer_id, Order.pharmacy_id).filter_by(id=order_id)
+        ).first()
+        if row is None:
+            return jsonify({
+                'success': False,
+                'message': 'Order not found'
+            }), 404
+
+        if not can_access_order(user, row):
             return jsonify({
                 'success': False,
                 'message': 'Access denied'
             }), 403
-        
+
+        order = db.session.get(Order, order_id)
+
         # Check if order can be cancelled
         if not order.can_be_cancelled():
             return jsonify({
@@ -325,7 +529,7 @@ def cancel_order(order_id):
         return jsonify({
             'success': True,
             'message': 'Order cancelled successfully',
-            'order': order.to_dict()
+            'order': _order_summary(order)
         })
         
     except Exception as e:
@@ -1,24 +1,58 @@
-from flask import Blueprint, request, jsonify, current_app
+from flask import Blueprint, Response, request, jsonify, current_app, stream_with_context
 from flask_jwt_extended import jwt_required
-from datetime import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, time
+import os
 
-from src.models import db, Pharmacy, PharmacyDocument, Product, PharmacyStatus, UserType
+import orjson
+from werkzeug.utils import secure_filename
+
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import contains_eager, joinedload, selectinload
+
+from src.models import db, DocumentType, Pharmacy, PharmacyDocument, PharmacyOperatingHours, PharmacyProduct, Product, PharmacyStatus, UserType
 from src.utils.auth import get_current_user, log_audit_action, require_seller, require_seller_or_admin, can_access_pharmacy
-from src.utils.validation import validate_required_fields, validate_coordinates, validate_price, validate_quantity, sanitize_string
+from src.utils.validation import (
+    validate_required_fields, validate_coordinates, validate_price, validate_quantity,
+    validate_phone, validate_email, validate_file_upload, sanitize_string
+)
 
 pharmacies_bp = Blueprint('pharmacies', __name__)
 
+# Time-of-day fields accepted per operating-hours entry
+_TIME_FIELDS = ('opening_time', 'closing_time', 'break_start_time', 'break_end_time')
+
+# Document bytes are written to storage off the request thread; a single
+# worker keeps writes ordered, same pattern as the auth and email
+# background executors
+_upload_writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix='doc-writer')
+
+def _write_document(app, path, payload):
+    """Persist uploaded document bytes on the background writer"""
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as fh:
+            fh.write(payload)
+    except Exception:
+        app.logger.exception('Document write failed for %s', path)
+
 @pharmacies_bp.route('/profile', methods=['GET'])
 @require_seller
 def get_pharmacy_profile():
     """Get pharmacy profile for authenticated seller"""
     try:
         user = get_current_user()
-        pharmacy = user.pharmacy
-        
+        # Both collections eager-load alongside the pharmacy row: one
+        # primary SELECT plus two IN() queries instead of a lazy load per
+        # collection touched below
+        pharmacy = Pharmacy.query.options(
+            selectinload(Pharmacy.operating_hours),
+            selectinload(Pharmacy.documents)
+        ).filter_by(seller_id=user.id).first()
+
         if not pharmacy:
             return jsonify({'error': 'Pharmacy not found'}), 404
-        
+
         # Include related data
         profile_data = pharmacy.to_dict()
         profile_data['operating_hours'] = [hours.to_dict() for hours in pharmacy.operating_hours]
@@ -47,9 +81,6 @@ def update_pharmacy_profile():
         if not data:
             return jsonify({'error': 'No data provided'}), 400
         
-        # Store old values for audit
-        old_values = pharmacy.to_dict()
-        
         # Validate coordinates if provided
         if data.get('latitude') and data.get('longitude'):
             coord_validation = validate_coordinates(data['latitude'], data['longitude'])
@@ -62,8 +93,24 @@ def update_pharmacy_profile():
             'phone_number', 'email', 'website_url', 'facebook_url', 'instagram_url',
             'whatsapp_number', 'district', 'detailed_address', 'latitude', 'longitude'
         ]
-        
-        for field in updatable_fields:
+
+        # Work out what actually changes first; a no-op PUT returns
+        # without validation churn, a commit, or an audit row
+        changed = [
+            field for field in updatable_fields
+            if field in data and data[field] != getattr(pharmacy, field, None)
+        ]
+        if not changed:
+            return jsonify({
+                'message': 'Pharmacy profile updated successfully',
+                'pharmacy': pharmacy.to_dict()
+            }), 200
+
+        # Audit snapshots cover only the fields that change, not a full
+        # serialization per side
+        old_values = pharmacy.to_dict(fields=changed)
+
+        for field in changed:
             if field in data:
                 if field in ['pharmacy_name', 'district']:
                     # Required fields
@@ -80,7 +127,6 @@ def update_pharmacy_profile():
                 elif field in ['phone_number', 'whatsapp_number']:
                     # Phone number fields
                     if data[field]:
-                        from src.utils.validation import validate_phone
                         if not validate_phone(data[field]):
                             return jsonify({'error': f'Invalid {field} format'}), 400
                     setattr(pharmacy, field, data[field])
@@ -88,7 +134,6 @@ def update_pharmacy_profile():
                 elif field == 'email':
                     # Email field
                     if data[field]:
-                        from src.utils.validation import validate_email
                         if not validate_email(data[field]):
                             return jsonify({'error': 'Invalid email format'}), 400
                     setattr(pharmacy, field, data[field])
@@ -96,14 +141,19 @@ def update_pharmacy_profile():
                 else:
                     setattr(pharmacy, field, data[field])
         
+        # Flush to fire onupdate timestamps, then serialize before the
+        # commit expires the instance — avoids a refresh SELECT
+        db.session.flush()
+        new_values = pharmacy.to_dict(fields=changed)
+        profile_data = pharmacy.to_dict()
         db.session.commit()
-        
+
         # Log audit action
-        log_audit_action(user.id, 'pharmacy_updated', 'pharmacies', pharmacy.id, old_values, pharmacy.to_dict())
-        
+        log_audit_action(user.id, 'pharmacy_updated', 'pharmacies', pharmacy.id, old_values, new_values)
+
         return jsonify({
             'message': 'Pharmacy profile updated successfully',
-            'pharmacy': pharmacy.to_dict()
+            'pharmacy': profile_data
         }), 200
         
     except Exception as e:
@@ -117,11 +167,13 @@ def get_operating_hours():
     """Get pharmacy operating hours"""
     try:
         user = get_current_user()
-        pharmacy = user.pharmacy
-        
+        pharmacy = Pharmacy.query.options(
+            selectinload(Pharmacy.operating_hours)
+        ).filter_by(seller_id=user.id).first()
+
         if not pharmacy:
             return jsonify({'error': 'Pharmacy not found'}), 404
-        
+
         hours = [hour.to_dict() for hour in pharmacy.operating_hours]
         
         return jsonify({
@@ -147,62 +199,52 @@ def set_operating_hours():
         if not data or 'hours' not in data:
             return jsonify({'error': 'Operating hours data required'}), 400
         
-        # Clear existing hours
-        PharmacyOperatingHours.query.filter_by(pharmacy_id=pharmacy.id).delete()
-        
-        # Add new hours
-        for hour_data in data['hours']:
+        # Pure validation pass first, collecting every problem so the
+        # client fixes the whole payload in one round trip; the DB is
+        # only touched once the full week parses
+        rows = []
+        errors = []
+        for index, hour_data in enumerate(data['hours']):
             if 'day_of_week' not in hour_data:
-                return jsonify({'error': 'day_of_week is required for each hour entry'}), 400
-            
+                errors.append({'index': index, 'error': 'day_of_week is required for each hour entry'})
+                continue
+
             # Validate day of week
             day_of_week = hour_data['day_of_week']
             if not isinstance(day_of_week, int) or day_of_week < 0 or day_of_week > 6:
-                return jsonify({'error': 'day_of_week must be between 0 and 6'}), 400
-            
-            # Parse times
-            opening_time = None
-            closing_time = None
-            break_start_time = None
-            break_end_time = None
-            
+                errors.append({'index': index, 'error': 'day_of_week must be between 0 and 6'})
+                continue
+
+            # Parse the four time fields through one table-driven loop
+            # instead of four copies of the same try/except block
+            parsed = dict.fromkeys(_TIME_FIELDS)
+            entry_valid = True
             if not hour_data.get('is_closed', False):
-                if hour_data.get('opening_time'):
-                    try:
-                        opening_time = time.fromisoformat(hour_data['opening_time'])
-                    except ValueError:
-                        return jsonify({'error': f'Invalid opening_time format for day {day_of_week}'}), 400
-                
-                if hour_data.get('closing_time'):
-                    try:
-                        closing_time = time.fromisoformat(hour_data['closing_time'])
-                    except ValueError:
-                        return jsonify({'error': f'Invalid closing_time format for day {day_of_week}'}), 400
-                
-                if hour_data.get('break_start_time'):
-                    try:
-                        break_start_time = time.fromisoformat(hour_data['break_start_time'])
-                    except ValueError:
-                        return jsonify({'error': f'Invalid break_start_time format for day {day_of_week}'}), 400
-                
-                if hour_data.get('break_end_time'):
-                    try:
-                        break_end_time = time.fromisoformat(hour_data['break_end_time'])
-                    except ValueError:
-                        return jsonify({'error': f'Invalid break_end_time format for day {day_of_week}'}), 400
-            
-            operating_hour = PharmacyOperatingHours(
-                pharmacy_id=pharmacy.id,
-                day_of_week=day_of_week,
-                opening_time=opening_time,
-                closing_time=closing_time,
-                is_closed=hour_data.get('is_closed', False),
-                break_start_time=break_start_time,
-                break_end_time=break_end_time
-            )
-            
-            db.session.add(operating_hour)
-        
+                for field in _TIME_FIELDS:
+                    value = hour_data.get(field)
+                    if value:
+                        try:
+                            parsed[field] = time.fromisoformat(value)
+                        except ValueError:
+                            errors.append({'index': index, 'error': f'Invalid {field} format for day {day_of_week}'})
+                            entry_valid = False
+            if not entry_valid:
+                continue
+
+            rows.append({
+                'pharmacy_id': pharmacy.id,
+                'day_of_week': day_of_week,
+                'is_closed': hour_data.get('is_closed', False),
+                **parsed
+            })
+
+        if errors:
+            return jsonify({'error': 'Invalid operating hours', 'errors': errors}), 400
+
+        # Rewrite the week as one DELETE plus one executemany INSERT
+        PharmacyOperatingHours.query.filter_by(pharmacy_id=pharmacy.id).delete()
+        if rows:
+            db.session.execute(PharmacyOperatingHours.__table__.insert(), rows)
         db.session.commit()
         
         # Log audit action
@@ -223,11 +265,13 @@ def get_documents():
     """Get pharmacy documents"""
     try:
         user = get_current_user()
-        pharmacy = user.pharmacy
-        
+        pharmacy = Pharmacy.query.options(
+            selectinload(Pharmacy.documents)
+        ).filter_by(seller_id=user.id).first()
+
         if not pharmacy:
             return jsonify({'error': 'Pharmacy not found'}), 404
-        
+
         documents = [doc.to_dict() for doc in pharmacy.documents]
         
         return jsonify({
@@ -259,44 +303,60 @@ def upload_document():
         
         if not document_type:
             return jsonify({'error': 'Document type is required'}), 400
-        
+
         # Validate document type
         try:
             doc_type = DocumentType(document_type)
         except ValueError:
             return jsonify({'error': 'Invalid document type'}), 400
-        
+
         # Validate file
-        from src.utils.validation import validate_file_upload
         allowed_extensions = ['pdf', 'jpg', 'jpeg', 'png']
         max_size = 16 * 1024 * 1024  # 16MB
-        
+
         file_validation = validate_file_upload(file, allowed_extensions, max_size)
         if not file_validation['valid']:
             return jsonify({'error': file_validation['message']}), 400
-        
-        # TODO: Implement file upload to storage service
-        # For now, we'll just store a placeholder URL
-        document_url = f"/uploads/pharmacy_documents/{pharmacy.id}/{file.filename}"
-        
+
+        # Read the bytes here (the stream dies with the request), then
+        # hand the disk write to the background writer so the response
+        # doesn't block on storage I/O
+        filename = secure_filename(file.filename)
+        payload = file.read()
+        file_path = f"/uploads/pharmacy_documents/{pharmacy.id}/{filename}"
+        storage_root = current_app.config.get(
+            'UPLOAD_FOLDER', os.path.join(current_app.root_path, 'uploads')
+        )
+        absolute_path = os.path.join(
+            storage_root, 'pharmacy_documents', str(pharmacy.id), filename
+        )
+        _upload_writer.submit(
+            _write_document, current_app._get_current_object(), absolute_path, payload
+        )
+
         # Create document record
         document = PharmacyDocument(
             pharmacy_id=pharmacy.id,
-            document_type=doc_type,
-            document_url=document_url,
-            document_name=document_name or file.filename,
-            verification_status=VerificationStatus.PENDING
+            document_type=doc_type.value,
+            document_name=document_name or filename,
+            file_path=file_path,
+            file_size=len(payload),
+            mime_type=file.mimetype
         )
-        
+
         db.session.add(document)
+        # Serialize after flush, before commit, so the response doesn't
+        # pay a post-commit refresh SELECT
+        db.session.flush()
+        document_data = document.to_dict()
         db.session.commit()
-        
+
         # Log audit action
-        log_audit_action(user.id, 'document_uploaded', 'pharmacy_documents', document.id, {}, document.to_dict())
-        
+        log_audit_action(user.id, 'document_uploaded', 'pharmacy_documents', document_data['id'], {}, document_data)
+
         return jsonify({
             'message': 'Document uploaded successfully',
-            'document': document.to_dict()
+            'document': document_data
         }), 201
         
     except Exception as e:
@@ -324,21 +384,33 @@ def get_pharmacy_products():
         
         # Build query
         query = PharmacyProduct.query.filter_by(pharmacy_id=pharmacy.id)
-        
-        # Join with product for search
+
+        # Search and category filters share one Product join; when that
+        # join is present the eager load reuses it via contains_eager,
+        # otherwise the products come back in a single batched IN() query.
+        # Either way the per-row lazy load in the response loop is gone
+        needs_product_join = bool(search or category_id)
+        if needs_product_join:
+            query = query.join(Product)
+
         if search:
-            query = query.join(Product).filter(
+            query = query.filter(
                 db.or_(
-                    Product.product_name.ilike(f'%{search}%'),
-                    Product.product_name_ar.ilike(f'%{search}%'),
-                    Product.generic_name.ilike(f'%{search}%'),
-                    Product.brand_name.ilike(f'%{search}%')
+                    Product.name.ilike(f'%{search}%'),
+                    Product.name_ar.ilike(f'%{search}%'),
+                    Product.brand.ilike(f'%{search}%'),
+                    Product.manufacturer.ilike(f'%{search}%')
                 )
             )
-        
+
         # Filter by category
         if category_id:
-            query = query.join(Product).filter(Product.category_id == category_id)
+            query = query.filter(Product.category_id == category_id)
+
+        if needs_product_join:
+            query = query.options(contains_eager(PharmacyProduct.product))
+        else:
+            query = query.options(selectinload(PharmacyProduct.product))
         
         # Filter by availability
         if availability == 'available':
@@ -354,20 +426,96 @@ def get_pharmacy_products():
                 )
             )
         
-        # Paginate
-        pagination = query.paginate(
+        ordered = query.order_by(
+            PharmacyProduct.created_at.desc(), PharmacyProduct.id.desc()
+        )
+
+        def format_rows(rows):
+            products = []
+            for pharmacy_product in rows:
+                product_data = pharmacy_product.to_dict()
+                product_data['product'] = pharmacy_product.product.to_dict()
+                products.append(product_data)
+            return products
+
+        # ?stream=1 exports the whole filtered inventory as one
+        # incrementally written response: rows come off the cursor in
+        # batches of 200 and each is serialized and flushed as reached,
+        # so peak memory is one batch regardless of inventory size
+        if request.args.get('stream') == '1':
+            def generate():
+                yield b'{"products":['
+                sep = b''
+                for pharmacy_product in ordered.yield_per(200):
+                    product_data = pharmacy_product.to_dict()
+                    product_data['product'] = pharmacy_product.product.to_dict()
+                    yield sep + orjson.dumps(product_data)
+                    sep = b','
+                yield b']}'
+
+            return Response(
+                stream_with_context(generate()),
+                mimetype='application/json'
+            )
+
+        # Keyset pagination: ?after=<created_at_iso>,<id> walks the
+        # (pharmacy_id, created_at, id) index with no COUNT(*) and no
+        # OFFSET row-skip, so deep inventory pages cost the same as the
+        # first
+        after = request.args.get('after')
+        if after is not None:
+            try:
+                after_ts_raw, after_id_raw = after.rsplit(',', 1)
+                after_ts = datetime.fromisoformat(after_ts_raw)
+                after_id = int(after_id_raw)
+            except ValueError:
+                return jsonify({'error': 'Invalid cursor'}), 400
+
+            rows = ordered.filter(
+                db.or_(
+                    PharmacyProduct.created_at < after_ts,
+                    db.and_(
+                        PharmacyProduct.created_at == after_ts,
+                        PharmacyProduct.id < after_id
+                    )
+                )
+            ).limit(per_page + 1).all()
+
+            has_more = len(rows) > per_page
+            rows = rows[:per_page]
+            next_cursor = f"{rows[-1].created_at.isoformat()},{rows[-1].id}" if has_more else None
+
+            return jsonify({
+                'products': format_rows(rows),
+                'pagination': {
+                    'per_page': per_page,
+                    'next_cursor': next_cursor,
+                    'has_more': has_more
+                }
+            }), 200
+
+        # ?count=false keeps page numbers but drops paginate()'s
+        # COUNT(*): fetch one extra row and report has_next from that
+        if request.args.get('count', 'true') == 'false':
+            rows = ordered.limit(per_page + 1).offset((page - 1) * per_page).all()
+            has_next = len(rows) > per_page
+            return jsonify({
+                'products': format_rows(rows[:per_page]),
+                'pagination': {
+                    'page': page,
+                    'per_page': per_page,
+                    'has_next': has_next,
+                    'has_prev': page > 1
+                }
+            }), 200
+
+        # Page-numbered fallback for existing clients
+        pagination = ordered.paginate(
             page=page, per_page=per_page, error_out=False
         )
-        
-        # Format results
-        products = []
-        for pharmacy_product in pagination.items:
-            product_data = pharmacy_product.to_dict()
-            product_data['product'] = pharmacy_product.product.to_dict()
-            products.append(product_data)
-        
+
         return jsonify({
-            'products': products,
+            'products': format_rows(pagination.items),
             'pagination': {
                 'page': pagination.page,
                 'pages': pagination.pages,
@@ -403,19 +551,12 @@ def add_pharmacy_product():
         if not validation['valid']:
             return jsonify({'error': validation['message']}), 400
         
-        # Validate product exists
-        product = Product.query.get(data['product_id'])
+        # Validate product exists (identity-map fast path skips the query
+        # when the product is already in the session)
+        product = db.session.get(Product, data['product_id'])
         if not product:
             return jsonify({'error': 'Product not found'}), 404
-        
-        # Check if product already exists in pharmacy
-        existing = PharmacyProduct.query.filter_by(
-            pharmacy_id=pharmacy.id,
-            product_id=data['product_id']
-        ).first()
-        if existing:
-            return jsonify({'error': 'Product already exists in pharmacy inventory'}), 409
-        
+
         # Validate price and quantity
         price_validation = validate_price(data['price'])
         if not price_validation['valid']:
@@ -440,14 +581,25 @@ def add_pharmacy_product():
         )
         
         db.session.add(pharmacy_product)
+        # No pre-check SELECT: the unique constraint on
+        # (pharmacy_id, product_id) decides duplicates atomically,
+        # closing the check-then-insert race
+        try:
+            db.session.flush()
+        except IntegrityError:
+            db.session.rollback()
+            return jsonify({'error': 'Product already exists in pharmacy inventory'}), 409
+
+        # Serialize before the commit: flush already assigned id and
+        # timestamps, while reading attributes after commit would expire
+        # and re-SELECT the row
+        listing = pharmacy_product.to_dict()
+        result = dict(listing)
+        result['product'] = product.to_dict()
         db.session.commit()
-        
+
         # Log audit action
-        log_audit_action(user.id, 'product_added', 'pharmacy_products', pharmacy_product.id, {}, pharmacy_product.to_dict())
-        
-        # Include product details in response
-        result = pharmacy_product.to_dict()
-        result['product'] = product.to_dict()
+        log_audit_action(user.id, 'product_added', 'pharmacy_products', listing['id'], {}, listing)
         
         return jsonify({
             'message': 'Product added to inventory successfully',
@@ -470,27 +622,32 @@ def update_pharmacy_product(pharmacy_product_id):
         if not pharmacy:
             return jsonify({'error': 'Pharmacy not found'}), 404
         
-        pharmacy_product = PharmacyProduct.query.filter_by(
+        # joinedload brings the product along for the response payload,
+        # saving the lazy SELECT the success path used to trigger
+        pharmacy_product = PharmacyProduct.query.options(
+            joinedload(PharmacyProduct.product)
+        ).filter_by(
             id=pharmacy_product_id,
             pharmacy_id=pharmacy.id
         ).first()
-        
+
         if not pharmacy_product:
             return jsonify({'error': 'Product not found in inventory'}), 404
-        
+
         data = request.get_json()
         if not data:
             return jsonify({'error': 'No data provided'}), 400
         
-        # Store old values for audit
-        old_values = pharmacy_product.to_dict()
-        
         # Update allowed fields
         updatable_fields = [
             'price', 'quantity_available', 'minimum_quantity', 'maximum_quantity',
             'custom_image_url', 'pharmacy_notes', 'pharmacy_notes_ar', 'is_available'
         ]
-        
+
+        # Audit snapshot limited to the updatable columns
+        old_values = pharmacy_product.to_dict(fields=updatable_fields)
+
+
         for field in updatable_fields:
             if field in data:
                 if field == 'price':
@@ -512,14 +669,16 @@ def update_pharmacy_product(pharmacy_product_id):
                 else:
                     setattr(pharmacy_product, field, data[field])
         
-        db.session.commit()
-        
-        # Log audit action
-        log_audit_action(user.id, 'product_updated', 'pharmacy_products', pharmacy_product.id, old_values, pharmacy_product.to_dict())
-        
-        # Include product details in response
+        # Flush, serialize, then commit: same no-refresh pattern as the
+        # other write handlers
+        db.session.flush()
+        new_values = pharmacy_product.to_dict(fields=updatable_fields)
         result = pharmacy_product.to_dict()
         result['product'] = pharmacy_product.product.to_dict()
+        db.session.commit()
+
+        # Log audit action
+        log_audit_action(user.id, 'product_updated', 'pharmacy_products', pharmacy_product_id, old_values, new_values)
         
         return jsonify({
             'message': 'Product updated successfully',
@@ -542,22 +701,37 @@ def remove_pharmacy_product(pharmacy_product_id):
         if not pharmacy:
             return jsonify({'error': 'Pharmacy not found'}), 404
         
-        pharmacy_product = PharmacyProduct.query.filter_by(
-            id=pharmacy_product_id,
-            pharmacy_id=pharmacy.id
+        # One DELETE with RETURNING replaces the fetch + delete pair; the
+        # returned columns keep the audit snapshot without a prior SELECT
+        row = db.session.execute(
+            PharmacyProduct.__table__.delete()
+            .where(
+                PharmacyProduct.id == pharmacy_product_id,
+                PharmacyProduct.pharmacy_id == pharmacy.id
+            )
+            .returning(
+                PharmacyProduct.product_id,
+                PharmacyProduct.price,
+                PharmacyProduct.quantity_available
+            )
         ).first()
-        
-        if not pharmacy_product:
+
+        if row is None:
+            db.session.rollback()
             return jsonify({'error': 'Product not found in inventory'}), 404
-        
-        # Store values for audit
-        old_values = pharmacy_product.to_dict()
-        
-        db.session.delete(pharmacy_product)
+
         db.session.commit()
-        
+
         # Log audit action
-        log_audit_action(user.id, 'product_removed', 'pharmacy_products', pharmacy_product_id, old_values, {})
+        log_audit_action(
+            user.id, 'product_removed', 'pharmacy_products', pharmacy_product_id,
+            {
+                'product_id': row.product_id,
+                'price': float(row.price) if row.price else 0.0,
+                'quantity_available': row.quantity_available
+            },
+            {}
+        )
         
         return jsonify({
             'message': 'Product removed from inventory successfully'
@@ -1,12 +1,45 @@
 from flask import Blueprint, request, jsonify, current_app
 from flask_jwt_extended import jwt_required
+import time
 
-from src.models import db, Product, ProductCategory
-from src.utils.auth import get_current_user, log_audit_action, require_admin
+from src.models import db, Product, ProductCategory, ProductStatus
+from src.utils.auth import get_current_user, get_redis, log_audit_action, require_admin
 from src.utils.validation import validate_required_fields, sanitize_string
 
 products_bp = Blueprint('products', __name__)
 
+# Serialized responses for the public read endpoints. Categories change
+# rarely (there is no write endpoint for them), the catalog tolerates a
+# couple of minutes of staleness; both age out on TTL alone. Redis when
+# configured, bounded in-process dict otherwise
+_CATEGORIES_TTL = 3600  # seconds
+_CATALOG_TTL = 120  # seconds
+_response_cache = {}
+
+def _cache_get(key):
+    client = get_redis()
+    if client is not None:
+        try:
+            return client.get(key)
+        except Exception as e:
+            current_app.logger.error(f"Catalog cache read failed: {str(e)}")
+    cached = _response_cache.get(key)
+    if cached and cached[0] > time.monotonic():
+        return cached[1]
+    return None
+
+def _cache_set(key, body, ttl):
+    client = get_redis()
+    if client is not None:
+        try:
+            client.setex(key, ttl, body)
+            return
+        except Exception as e:
+            current_app.logger.error(f"Catalog cache write failed: {str(e)}")
+    if len(_response_cache) > 4096:
+        _response_cache.clear()
+    _response_cache[key] = (time.monotonic() + ttl, body)
+
 @products_bp.route('/catalog', methods=['GET'])
 def get_product_catalog():
     """Get product catalog (public endpoint)"""
@@ -16,18 +49,25 @@ def get_product_catalog():
         per_page = min(request.args.get('per_page', 20, type=int), 100)
         search = request.args.get('search', '')
         category_id = request.args.get('category_id')
-        
+
+        want_count = request.args.get('count', 'true') != 'false'
+
+        cache_key = f'catalog:{search}:{category_id}:{page}:{per_page}:{want_count}'
+        cached = _cache_get(cache_key)
+        if cached is not None:
+            return current_app.response_class(cached, mimetype='application/json')
+
         # Build query
-        query = Product.query.filter_by(is_active=True)
+        query = Product.query.filter_by(status=ProductStatus.ACTIVE)
         
         # Search filter
         if search:
             query = query.filter(
                 db.or_(
-                    Product.product_name.ilike(f'%{search}%'),
-                    Product.product_name_ar.ilike(f'%{search}%'),
-                    Product.generic_name.ilike(f'%{search}%'),
-                    Product.brand_name.ilike(f'%{search}%')
+                    Product.name.ilike(f'%{search}%'),
+                    Product.name_ar.ilike(f'%{search}%'),
+                    Product.brand.ilike(f'%{search}%'),
+                    Product.manufacturer.ilike(f'%{search}%')
                 )
             )
         
@@ -35,14 +75,32 @@ def get_product_catalog():
         if category_id:
             query = query.filter_by(category_id=category_id)
         
+        # ?count=false drops paginate()'s COUNT(*) — often costlier than
+        # the page fetch on a filtered catalog — and derives has_next
+        # from one extra fetched row
+        if not want_count:
+            rows = query.limit(per_page + 1).offset((page - 1) * per_page).all()
+            has_next = len(rows) > per_page
+            body = current_app.json.dumps({
+                'products': [product.to_dict() for product in rows[:per_page]],
+                'pagination': {
+                    'page': page,
+                    'per_page': per_page,
+                    'has_next': has_next,
+                    'has_prev': page > 1
+                }
+            })
+            _cache_set(cache_key, body, _CATALOG_TTL)
+            return current_app.response_class(body, mimetype='application/json')
+
         # Paginate
         pagination = query.paginate(
             page=page, per_page=per_page, error_out=False
         )
-        
+
         products = [product.to_dict() for product in pagination.items]
-        
-        return jsonify({
+
+        body = current_app.json.dumps({
             'products': products,
             'pagination': {
                 'page': pagination.page,
@@ -52,7 +110,10 @@ def get_product_catalog():
                 'has_next': pagination.has_next,
                 'has_prev': pagination.has_prev
             }
-        }), 200
+        })
+        _cache_set(cache_key, body, _CATALOG_TTL)
+
+        return current_app.response_class(body, mimetype='application/json')
         
     except Exception as e:
         current_app.logger.error(f"Get product catalog error: {str(e)}")
@@ -62,10 +123,17 @@ def get_product_catalog():
 def get_categories():
     """Get product categories"""
     try:
+        cached = _cache_get('categories:active')
+        if cached is not None:
+            return current_app.response_class(cached, mimetype='application/json')
+
         categories = ProductCategory.query.filter_by(is_active=True).order_by(ProductCategory.sort_order).all()
-        return jsonify({
+        body = current_app.json.dumps({
             'categories': [category.to_dict() for category in categories]
-        }), 200
+        })
+        _cache_set('categories:active', body, _CATEGORIES_TTL)
+
+        return current_app.response_class(body, mimetype='application/json')
         
     except Exception as e:
         current_app.logger.error(f"Get categories error: {str(e)}")
@@ -75,8 +143,8 @@ def get_categories():
 def get_product(product_id):
     """Get product details"""
     try:
-        product = Product.query.get(product_id)
-        if not product or not product.is_active:
+        product = db.session.get(Product, product_id)
+        if not product or product.status != ProductStatus.ACTIVE:
             return jsonify({'error': 'Product not found'}), 404
         
         return jsonify({
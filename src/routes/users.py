@@ -1,28 +1,75 @@
 from flask import Blueprint, request, jsonify, current_app
 from flask_jwt_extended import jwt_required, get_jwt_identity
+import time
 
 from src.models import db, User, UserAddress
-from src.utils.auth import get_current_user, log_audit_action, generate_api_response, require_verified_user
+from src.utils.auth import get_current_user, get_redis, log_audit_action, generate_api_response, require_verified_user
 from src.utils.validation import validate_required_fields, validate_email, validate_phone, validate_coordinates, sanitize_string
 
 users_bp = Blueprint('users', __name__)
 
+# Serialized profile responses, cached briefly so the per-request user
+# fetch + serialization is skipped for chatty clients. Redis-backed when
+# configured (shared across workers), else a bounded per-process map.
+_PROFILE_TTL = 30  # seconds
+_profile_cache = {}
+
+def _get_cached_profile(user_id):
+    client = get_redis()
+    if client is not None:
+        try:
+            return client.get(f'profile:{user_id}')
+        except Exception as e:
+            current_app.logger.error(f"Profile cache read failed: {str(e)}")
+    cached = _profile_cache.get(user_id)
+    if cached and cached[0] > time.monotonic():
+        return cached[1]
+    return None
+
+def _store_profile(user_id, body):
+    client = get_redis()
+    if client is not None:
+        try:
+            client.setex(f'profile:{user_id}', _PROFILE_TTL, body)
+            return
+        except Exception as e:
+            current_app.logger.error(f"Profile cache write failed: {str(e)}")
+    if len(_profile_cache) > 5000:
+        _profile_cache.clear()
+    _profile_cache[user_id] = (time.monotonic() + _PROFILE_TTL, body)
+
+def _invalidate_profile(user_id):
+    """Drop the cached profile after any write that changes it"""
+    client = get_redis()
+    if client is not None:
+        try:
+            client.delete(f'profile:{user_id}')
+        except Exception as e:
+            current_app.logger.error(f"Profile cache invalidation failed: {str(e)}")
+    _profile_cache.pop(user_id, None)
+
 @users_bp.route('/profile', methods=['GET'])
 @jwt_required()
 def get_profile():
     """Get current user profile"""
     try:
+        user_id = int(get_jwt_identity())
+        cached = _get_cached_profile(user_id)
+        if cached is not None:
+            return current_app.response_class(cached, mimetype='application/json')
+
         user = get_current_user()
         if not user:
             return jsonify({'error': 'User not found'}), 404
-        
+
         # Include addresses in profile
         profile_data = user.to_dict()
         profile_data['addresses'] = [addr.to_dict() for addr in user.addresses]
-        
-        return jsonify({
-            'user': profile_data
-        }), 200
+
+        body = current_app.json.dumps({'user': profile_data})
+        _store_profile(user_id, body)
+
+        return current_app.response_class(body, mimetype='application/json')
         
     except Exception as e:
         current_app.logger.error(f"Get profile error: {str(e)}")
@@ -84,6 +131,8 @@ def update_profile():
         
         db.session.commit()
         
+        _invalidate_profile(user.id)
+
         # Log audit action
         log_audit_action(user.id, 'profile_updated', 'users', user.id, old_values, user.to_dict())
         
@@ -164,6 +213,8 @@ def add_address():
         db.session.add(address)
         db.session.commit()
         
+        _invalidate_profile(user.id)
+
         # Log audit action
         log_audit_action(user.id, 'address_added', 'user_addresses', address.id, {}, address.to_dict())
         
@@ -233,6 +284,8 @@ def update_address(address_id):
         
         db.session.commit()
         
+        _invalidate_profile(user.id)
+
         # Log audit action
         log_audit_action(user.id, 'address_updated', 'user_addresses', address.id, old_values, address.to_dict())
         
@@ -278,6 +331,8 @@ def delete_address(address_id):
         db.session.delete(address)
         db.session.commit()
         
+        _invalidate_profile(user.id)
+
         # Log audit action
         log_audit_action(user.id, 'address_deleted', 'user_addresses', address_id, old_values, {})
         
@@ -360,6 +415,8 @@ def deactivate_account():
         user.is_active = False
         db.session.commit()
         
+        _invalidate_profile(user.id)
+
         # Log audit action
         log_audit_action(user.id, 'account_deactivated', 'users', user.id, {'is_active': True}, {'is_active': False})
         
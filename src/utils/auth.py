@@ -1,8 +1,18 @@
 from functools import wraps
-from flask import request, jsonify, current_app
+from flask import request, jsonify, current_app, g
 from flask_jwt_extended import jwt_required, get_jwt_identity, get_jwt
 from datetime import datetime
+from decimal import Decimal
 import ipaddress
+import os
+import queue
+import threading
+import time
+
+try:
+    import redis as _redis
+except ImportError:  # pragma: no cover - optional dependency
+    _redis = None
 
 from src.models import db, User, AuditLog, UserType
 from src.models.admin import AuditAction
@@ -16,18 +26,19 @@ def require_user_type(*allowed_types):
         @wraps(f)
         @jwt_required()
         def decorated_function(*args, **kwargs):
-            current_user_id = get_jwt_identity()
-            user = User.query.get(current_user_id)
-            
+            # Resolve through the g-memoized lookup so the handler's own
+            # get_current_user() call reuses this SELECT
+            user = get_current_user()
+
             if not user:
                 return jsonify({'error': 'User not found'}), 404
-            
+
             if not user.is_active:
                 return jsonify({'error': 'Account is deactivated'}), 403
-            
+
             if user.user_type not in allowed_types:
                 return jsonify({'error': 'Insufficient permissions'}), 403
-            
+
             return f(*args, **kwargs)
         return decorated_function
     return decorator
@@ -37,15 +48,14 @@ def require_verified_user(f):
     @wraps(f)
     @jwt_required()
     def decorated_function(*args, **kwargs):
-        current_user_id = get_jwt_identity()
-        user = User.query.get(current_user_id)
-        
+        user = get_current_user()
+
         if not user:
             return jsonify({'error': 'User not found'}), 404
-        
+
         if not user.is_verified:
             return jsonify({'error': 'Email verification required'}), 403
-        
+
         return f(*args, **kwargs)
     return decorated_function
 
@@ -65,15 +75,138 @@ def require_seller_or_admin(f):
     """Decorator to require seller or admin user"""
     return require_user_type(UserType.SELLER, UserType.ADMIN)(f)
 
+# Revoked-token (logout) blocklist. Backed by Redis when REDIS_URL is
+# configured so revocation is shared across workers; otherwise falls back
+# to an in-process dict of jti -> token expiry.
+_redis_client = None
+_blocklist = {}
+_blocklist_lock = threading.Lock()
+
+def _get_redis():
+    """Return the shared Redis client, or None when Redis isn't available"""
+    global _redis_client
+    if _redis is None:
+        return None
+    if _redis_client is None:
+        redis_url = os.getenv('REDIS_URL')
+        if not redis_url:
+            return None
+        _redis_client = _redis.Redis.from_url(redis_url)
+    return _redis_client
+
+def get_redis():
+    """Shared optional Redis client for route-level caches (None if unset)"""
+    return _get_redis()
+
+def revoke_token(jti, expires_at):
+    """
+    Add a token to the blocklist until its natural expiry
+
+    Args:
+        jti: JWT ID claim of the token to revoke
+        expires_at: token 'exp' claim (unix timestamp)
+    """
+    client = _get_redis()
+    if client is not None:
+        try:
+            ttl = max(int(expires_at - time.time()), 1)
+            client.setex(f'jwt_blocklist:{jti}', ttl, '1')
+            return
+        except Exception as e:
+            current_app.logger.error(f"Redis blocklist write failed: {str(e)}")
+
+    with _blocklist_lock:
+        _blocklist[jti] = expires_at
+        if len(_blocklist) > 10000:
+            now = time.time()
+            for key in [k for k, exp in _blocklist.items() if exp <= now]:
+                del _blocklist[key]
+
+def is_token_revoked(jti):
+    """Check whether a token jti has been revoked via logout"""
+    client = _get_redis()
+    if client is not None:
+        try:
+            return bool(client.exists(f'jwt_blocklist:{jti}'))
+        except Exception:
+            pass
+
+    expires_at = _blocklist.get(jti)
+    return expires_at is not None and expires_at > time.time()
+
+# Fixed-window counters for rate_limit(), keyed by (endpoint, ip, email)
+_rate_buckets = {}
+_rate_lock = threading.Lock()
+
+def rate_limit(max_attempts=5, time_window=60):
+    """
+    Decorator to rate-limit an endpoint per client IP + request email
+    Usage: @rate_limit(max_attempts=5, time_window=60)
+
+    Rejects with 429 before the handler runs, so no DB query or password
+    hash work is spent on abusive traffic. Counters live in Redis when
+    REDIS_URL is configured, so the limits are shared across workers;
+    otherwise each worker keeps its own fixed-window buckets.
+    """
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            payload = request.get_json(silent=True) or {}
+            key = (f.__name__, get_client_ip(), str(payload.get('email', '')))
+
+            client = _get_redis()
+            if client is not None:
+                try:
+                    redis_key = 'rate_limit:' + ':'.join(key)
+                    attempts = client.incr(redis_key)
+                    if attempts == 1:
+                        client.expire(redis_key, time_window)
+                    if attempts > max_attempts:
+                        return jsonify({'error': 'Too many attempts. Please try again later.'}), 429
+                    return f(*args, **kwargs)
+                except Exception as e:
+                    current_app.logger.error(f"Redis rate limit failed: {str(e)}")
+
+            now = time.monotonic()
+            with _rate_lock:
+                window_start, attempts = _rate_buckets.get(key, (now, 0))
+                if now - window_start >= time_window:
+                    window_start, attempts = now, 0
+                attempts += 1
+                _rate_buckets[key] = (window_start, attempts)
+
+                # Keep the bucket table bounded
+                if len(_rate_buckets) > 10000:
+                    expired = [k for k, (start, _) in _rate_buckets.items()
+                               if now - start >= time_window]
+                    for k in expired:
+                        del _rate_buckets[k]
+
+            if attempts > max_attempts:
+                return jsonify({'error': 'Too many attempts. Please try again later.'}), 429
+
+            return f(*args, **kwargs)
+        return decorated_function
+    return decorator
+
 def get_current_user():
-    """Get current authenticated user"""
+    """Get current authenticated user
+
+    Memoized on flask.g so helpers that re-resolve the user within the
+    same request share one SELECT instead of issuing their own.
+    """
+    if 'current_user' in g:
+        return g.current_user
+    user = None
     try:
         current_user_id = get_jwt_identity()
         if current_user_id:
-            return User.query.get(current_user_id)
+            # Identities travel as strings in the JWT 'sub' claim
+            user = User.query.get(int(current_user_id))
     except:
         pass
-    return None
+    g.current_user = user
+    return user
 
 def get_client_ip():
     """Get client IP address from request"""
@@ -97,10 +230,81 @@ def get_user_agent():
     """Get user agent from request"""
     return request.headers.get('User-Agent', '')
 
+# Audit rows are queued here and drained by a single background thread,
+# so request handlers never pay the extra INSERT round-trip
+_audit_queue = queue.Queue(maxsize=10000)
+_audit_thread = None
+_audit_thread_lock = threading.Lock()
+_AUDIT_FLUSH_INTERVAL = 0.1  # seconds to wait for more rows before flushing
+
+def _drain_audit_queue(app):
+    """Background writer: batch queued audit rows into single commits"""
+    while True:
+        rows = [_audit_queue.get()]
+        deadline = time.monotonic() + _AUDIT_FLUSH_INTERVAL
+        while True:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                rows.append(_audit_queue.get(timeout=timeout))
+            except queue.Empty:
+                break
+
+        with app.app_context():
+            try:
+                db.session.add_all([AuditLog(**row) for row in rows])
+                db.session.commit()
+            except Exception as e:
+                db.session.rollback()
+                app.logger.error(f"Audit batch of {len(rows)} failed, retrying per row: {str(e)}")
+                # Retry one row at a time so a single poison row can't
+                # take unrelated audit records down with it
+                for row in rows:
+                    try:
+                        db.session.add(AuditLog(**row))
+                        db.session.commit()
+                    except Exception as row_error:
+                        db.session.rollback()
+                        app.logger.error(f"Failed to write audit row: {str(row_error)}")
+
+def _ensure_audit_writer():
+    """Start the audit writer thread on first use"""
+    global _audit_thread
+    if _audit_thread is None or not _audit_thread.is_alive():
+        with _audit_thread_lock:
+            if _audit_thread is None or not _audit_thread.is_alive():
+                app = current_app._get_current_object()
+                _audit_thread = threading.Thread(
+                    target=_drain_audit_queue,
+                    args=(app,),
+                    name='audit-log-writer',
+                    daemon=True
+                )
+                _audit_thread.start()
+
+def _json_safe(values):
+    """Coerce a model snapshot to values the JSON columns can store
+
+    BaseModel.to_dict keeps raw column values (orjson handles them in
+    responses), but AuditLog's old_values/new_values serialize through
+    stdlib json at insert time, which rejects datetimes and Decimals.
+    """
+    if not values:
+        return values
+    out = {}
+    for key, value in values.items():
+        if hasattr(value, 'isoformat'):  # datetime, date, time
+            value = value.isoformat()
+        elif isinstance(value, Decimal):
+            value = float(value)
+        out[key] = value
+    return out
+
 def log_audit_action(user_id, action_type, target_type=None, target_id=None, description='', old_values=None, new_values=None):
     """
-    Log audit action to database
-    
+    Queue an audit action for the background writer
+
     Args:
         user_id: ID of user performing action
         action_type: Type of action (e.g., 'user_login', 'product_created')
@@ -108,26 +312,28 @@ def log_audit_action(user_id, action_type, target_type=None, target_id=None, des
         record_id: ID of affected record
         old_values: Previous values (for updates)
         new_values: New values (for creates/updates)
+
+    Request-bound values (IP, user agent) are captured here on the
+    request thread; the INSERT itself happens off the request path and
+    is batched with other pending rows.
     """
     try:
-        audit_log = AuditLog(
-            user_id=user_id,
-            action=AuditAction.LOGIN,
-            target_type=target_type,
-            target_id=target_id,
-            description=description,
-            old_values=old_values,
-            new_values=new_values,
-            ip_address=get_client_ip(),
-            user_agent=get_user_agent()
-        )
-        
-        db.session.add(audit_log)
-        db.session.commit()
-        
+        _ensure_audit_writer()
+        _audit_queue.put_nowait({
+            'user_id': user_id,
+            'action': AuditAction.LOGIN,
+            'target_type': target_type,
+            'target_id': target_id,
+            'description': description,
+            'old_values': _json_safe(old_values),
+            'new_values': _json_safe(new_values),
+            'ip_address': get_client_ip(),
+            'user_agent': get_user_agent()
+        })
+    except queue.Full:
+        current_app.logger.warning("Audit queue full, dropping audit action")
     except Exception as e:
         current_app.logger.error(f"Failed to log audit action: {str(e)}")
-        db.session.rollback()
 
 def check_rate_limit(user_id, action_type, max_attempts=5, time_window=300):
     """
@@ -159,6 +365,37 @@ def check_rate_limit(user_id, action_type, max_attempts=5, time_window=300):
         current_app.logger.error(f"Rate limit check failed: {str(e)}")
         return True  # Allow action if check fails
 
+# Seller -> pharmacy id resolution cache. Pharmacy assignment almost
+# never changes, yet every seller request re-ran a full Pharmacy SELECT
+# just to learn the id; a short TTL keeps the hot path at a dict lookup
+_SELLER_PHARMACY_TTL = 300  # seconds
+_seller_pharmacy_cache = {}
+
+def get_seller_pharmacy_id(user_id):
+    """Resolve a seller's pharmacy id, cached for a few minutes
+
+    Returns the pharmacy id or None when the seller has no pharmacy.
+    Only the id column is fetched on a miss.
+    """
+    now = time.monotonic()
+    cached = _seller_pharmacy_cache.get(user_id)
+    if cached is not None and cached[0] > now:
+        return cached[1]
+
+    from src.models import Pharmacy
+    pharmacy_id = db.session.execute(
+        db.select(Pharmacy.id).filter_by(seller_id=user_id)
+    ).scalar()
+
+    if len(_seller_pharmacy_cache) > 5000:
+        _seller_pharmacy_cache.clear()
+    _seller_pharmacy_cache[user_id] = (now + _SELLER_PHARMACY_TTL, pharmacy_id)
+    return pharmacy_id
+
+def invalidate_seller_pharmacy(user_id):
+    """Drop the cached pharmacy id after an assignment change"""
+    _seller_pharmacy_cache.pop(user_id, None)
+
 def is_pharmacy_owner(user_id, pharmacy_id):
     """Check if user owns the specified pharmacy"""
     try:
@@ -184,16 +421,21 @@ def can_access_pharmacy(user, pharmacy_id):
     return False
 
 def can_access_order(user, order):
-    """Check if user can access order data"""
+    """Check if user can access order data
+
+    Accepts a full Order or any row exposing customer_id and pharmacy_id,
+    so handlers can run the check on a lightweight column fetch before
+    paying for the whole object.
+    """
     if not user or not order:
         return False
-    
+
     # Admin can access all orders
     if user.user_type == UserType.ADMIN:
         return True
-    
+
     # Customer can access their own orders
-    if user.user_type == UserType.CUSTOMER and order.user_id == user.id:
+    if user.user_type == UserType.CUSTOMER and order.customer_id == user.id:
         return True
     
     # Seller can access orders for their pharmacy
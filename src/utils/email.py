@@ -1,5 +1,6 @@
 import os
 import logging
+from concurrent.futures import ThreadPoolExecutor
 from flask import current_app
 from sendgrid import SendGridAPIClient
 from sendgrid.helpers.mail import Mail, Email, To, Content, Attachment, FileContent, FileName, FileType, Disposition
@@ -9,6 +10,31 @@ import base64
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Shared pool for off-request email sends. The send_* helpers read their
+# configuration from the environment and do pure network I/O, so they can
+# run on worker threads without an app context.
+_email_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix='email-sender')
+
+def _log_async_result(future):
+    """Surface failures from background sends in the log"""
+    try:
+        result = future.result()
+        if not result.get('success'):
+            logger.error(f"Background email send failed: {result.get('error')}")
+    except Exception as e:
+        logger.error(f"Background email send raised: {str(e)}")
+
+def send_email_async(send_func, *args, **kwargs):
+    """
+    Run one of the send_* helpers off the request thread
+
+    Returns the Future; callers that don't care about the outcome can
+    ignore it — failures are logged by a done-callback either way.
+    """
+    future = _email_executor.submit(send_func, *args, **kwargs)
+    future.add_done_callback(_log_async_result)
+    return future
+
 def send_email(to_email, subject, html_content, text_content=None, attachments=None):
     """
     Send email using SendGrid API
@@ -0,0 +1,25 @@
+import base64
+import os
+import threading
+
+# Tokens are sliced from a per-thread entropy block so a signup burst
+# costs one getrandom syscall per ~170 tokens instead of one per token
+_TOKEN_BYTES = 24
+_POOL_SIZE = 4096
+
+_local = threading.local()
+
+def next_token():
+    """Return a URL-safe random token string
+
+    Same strength as secrets.token_urlsafe: the bytes come straight from
+    os.urandom, drawn in 4KB blocks per thread and consumed slice by
+    slice, with the block refilled when exhausted.
+    """
+    buf = getattr(_local, 'buf', None)
+    pos = getattr(_local, 'pos', 0)
+    if buf is None or pos + _TOKEN_BYTES > len(buf):
+        buf = _local.buf = os.urandom(_POOL_SIZE)
+        pos = 0
+    _local.pos = pos + _TOKEN_BYTES
+    return base64.urlsafe_b64encode(buf[pos:pos + _TOKEN_BYTES]).rstrip(b'=').decode('ascii')
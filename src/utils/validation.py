@@ -2,15 +2,27 @@ import re
 from typing import Dict, Any
 
 # Regular expressions for validation
-EMAIL_REGEX = re.compile(r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$')
+EMAIL_REGEX = re.compile(r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$', re.ASCII)
 PHONE_REGEX = re.compile(r'^(\+967|967|0)?[1-9]\d{7,8}$')  # Yemen phone number format
 PASSWORD_REGEX = re.compile(r'^(?=.*[a-z])(?=.*[A-Z])(?=.*\d)[a-zA-Z\d@$!%*?&]{8,}$')
 
+# Common weak passwords rejected outright
+WEAK_PASSWORDS = frozenset([
+    'password', '12345678', 'qwerty123', 'admin123', 'user1234',
+    'password123', '123456789', 'qwertyuiop', 'abc123456'
+])
+
 def validate_email(email: str) -> bool:
     """Validate email format"""
     if not email or not isinstance(email, str):
         return False
-    return bool(EMAIL_REGEX.match(email.strip()))
+    email = email.strip()
+    # Cheap structural rejects bound the input the regex engine ever sees:
+    # RFC 5321 caps addresses at 254 chars, there must be exactly one '@'
+    # and the domain part needs a dot
+    if len(email) > 254 or email.count('@') != 1 or '.' not in email.rpartition('@')[2]:
+        return False
+    return bool(EMAIL_REGEX.match(email))
 
 def validate_phone(phone: str) -> bool:
     """Validate Yemen phone number format"""
@@ -33,23 +45,28 @@ def validate_password(password: str) -> Dict[str, Any]:
     
     if len(password) > 128:
         return {'valid': False, 'message': 'Password must be less than 128 characters'}
-    
-    if not re.search(r'[a-z]', password):
+
+    # One pass over the string instead of a regex scan per character class
+    has_lower = has_upper = has_digit = False
+    for ch in password:
+        if 'a' <= ch <= 'z':
+            has_lower = True
+        elif 'A' <= ch <= 'Z':
+            has_upper = True
+        elif '0' <= ch <= '9':
+            has_digit = True
+
+    if not has_lower:
         return {'valid': False, 'message': 'Password must contain at least one lowercase letter'}
-    
-    if not re.search(r'[A-Z]', password):
+
+    if not has_upper:
         return {'valid': False, 'message': 'Password must contain at least one uppercase letter'}
-    
-    if not re.search(r'\d', password):
+
+    if not has_digit:
         return {'valid': False, 'message': 'Password must contain at least one number'}
-    
+
     # Check for common weak passwords
-    weak_passwords = [
-        'password', '12345678', 'qwerty123', 'admin123', 'user1234',
-        'password123', '123456789', 'qwertyuiop', 'abc123456'
-    ]
-    
-    if password.lower() in weak_passwords:
+    if password.lower() in WEAK_PASSWORDS:
         return {'valid': False, 'message': 'Password is too common, please choose a stronger password'}
     
     return {'valid': True, 'message': 'Password is valid'}
@@ -61,24 +78,51 @@ def validate_required_fields(data: Dict[str, Any], required_fields: list) -> Dic
     """
     if not isinstance(data, dict):
         return {'valid': False, 'message': 'Invalid data format'}
-    
-    missing_fields = []
-    empty_fields = []
-    
-    for field in required_fields:
-        if field not in data:
-            missing_fields.append(field)
-        elif not data[field] or (isinstance(data[field], str) and not data[field].strip()):
-            empty_fields.append(field)
-    
-    if missing_fields:
+
+    # Set difference finds missing keys in one C-level operation
+    missing = set(required_fields) - data.keys()
+    if missing:
+        missing_fields = [f for f in required_fields if f in missing]
         return {'valid': False, 'message': f'Missing required fields: {", ".join(missing_fields)}'}
-    
+
+    empty_fields = [
+        field for field in required_fields
+        if not data[field] or (isinstance(data[field], str) and not data[field].strip())
+    ]
     if empty_fields:
         return {'valid': False, 'message': f'Empty required fields: {", ".join(empty_fields)}'}
-    
+
     return {'valid': True, 'message': 'All required fields are valid'}
 
+def compile_required_fields(required_fields: list, prefix: str = ''):
+    """
+    Precompile a required-field check for a fixed set of fields
+    Returns a validator callable taking the request payload and returning
+    an error message string, or None when all fields are present
+
+    Compiling once at import time keeps the per-request work to a single
+    pass over a closed-over tuple instead of rebuilding field lists and
+    validator state inside the handlers.
+    """
+    fields = tuple(required_fields)
+    field_set = frozenset(fields)
+
+    def validator(data):
+        # One C-level set difference identifies missing keys; only then
+        # fall back to the per-field pass for empty values
+        missing = field_set - data.keys()
+        if missing:
+            for field in fields:
+                if field in missing:
+                    return f'{prefix}{field} is required'
+        for field in fields:
+            value = data[field]
+            if not value or (isinstance(value, str) and not value.strip()):
+                return f'{prefix}{field} is required'
+        return None
+
+    return validator
+
 def validate_coordinates(latitude: float, longitude: float) -> Dict[str, Any]:
     """
     Validate geographic coordinates